@@ -0,0 +1,315 @@
+import json
+import math
+from typing import List, Dict, Any, Optional
+from surveyschema import iter_questions, value_name
+
+# How answers of each SurveyJS question type are counted
+QUESTION_KINDS = {
+    "rating": "rating",
+    "radiogroup": "choice",
+    "dropdown": "choice",
+    "boolean": "choice",
+    "imagepicker": "choice",
+    "checkbox": "multichoice",
+    "tagbox": "multichoice",
+    "ranking": "multichoice",
+    "matrix": "matrix",
+    "multipletext": "items",
+}
+
+PERCENTILES = (25, 75, 90)
+
+# Longest rating scale listed value by value; a larger scale's answers are only counted as they arrive
+MAX_RATING_VALUES = 1000
+
+def choice_value(choice: Any) -> Any:
+    """Stored value of a choice item ("value|text" strings, {"value": ...} objects or plain values)"""
+    if isinstance(choice, dict):
+        return choice.get("value")
+    if isinstance(choice, str) and "|" in choice:
+        return choice.split("|", 1)[0]
+    return choice
+
+def as_number(value: Any, default: Any) -> Any:
+    """A definition property as an int or float (default when unset); None if it is not a finite number"""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return None
+        if value.is_integer():
+            value = int(value)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    # Beyond 2**53 the scale arithmetic is no longer exact (and huge ints do not convert to float)
+    if not abs(value) <= 2 ** 53:
+        return None
+    return value
+
+def rating_scale(question: Dict[str, Any]) -> Optional[tuple]:
+    """(low, high, step) of a rating question without rateValues; None if the definition has no usable scale"""
+    low = as_number(question.get("rateMin"), 1)
+    high = as_number(question.get("rateMax"), 5)
+    step = as_number(question.get("rateStep"), 1)
+    if low is None or high is None or step is None or step <= 0 or high < low:
+        return None
+    return low, high, step
+
+def rating_values(question: Dict[str, Any]) -> Optional[List[Any]]:
+    """Possible answers of a rating question; None if they are unknown or too many to list"""
+    rate_values = question.get("rateValues")
+    if rate_values:
+        return [choice_value(value) for value in rate_values] if isinstance(rate_values, list) else None
+    scale = rating_scale(question)
+    if scale is None:
+        return None
+    low, high, step = scale
+    # Survey definitions come from clients, so the size is checked before anything is built
+    count = (high - low) / step
+    if count >= MAX_RATING_VALUES:
+        return None
+    # Offsets from low rather than a running sum, which stops growing once step is below its precision
+    return [low + index * step for index in range(int(count + 1e-9) + 1)]
+
+def describe_questions(survey: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Summarize which questions of a survey are aggregated and how"""
+    questions = []
+    seen = set()
+    for question in iter_questions(survey):
+        name = value_name(question)
+        if name in seen:
+            continue
+        seen.add(name)
+        kind = QUESTION_KINDS.get(question.get("type"), "text")
+        described = {"name": name, "type": question.get("type"), "kind": kind}
+        if kind == "rating":
+            # An unknown scale lists no choices; its answers are still counted as they come
+            described["choices"] = rating_values(question) or []
+        elif kind in ("choice", "multichoice"):
+            described["choices"] = [choice_value(choice) for choice in question.get("choices") or []]
+            if question.get("type") == "boolean":
+                described["choices"] = [True, False]
+        elif kind == "matrix":
+            described["rows"] = [choice_value(row) for row in question.get("rows") or []]
+            described["choices"] = [choice_value(column) for column in question.get("columns") or []]
+        elif kind == "items":
+            described["rows"] = [item.get("name") for item in question.get("items") or [] if isinstance(item, dict)]
+        questions.append(described)
+    return questions
+
+def json_path(name: str) -> Optional[str]:
+    """SQLite JSON path of a top-level answer key; None if the key cannot be quoted"""
+    if '"' in name:
+        return None
+    return f'$."{name}"'
+
+def sql_histograms(cursor, post_id: str, questions: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Count answers per question (and per matrix row) with SQLite's JSON functions
+
+    Each histogram has an "answered" count and either "values" ({answer:
+    count}) or "rows" ({row: {answer: count}}).
+    """
+    histograms = {}
+    for question in questions:
+        path = json_path(question["name"])
+        if path is None:
+            continue
+        cursor.execute('''
+            SELECT COUNT(*) FROM responses
+            WHERE post_id = ? AND json_type(payload, ?) IS NOT NULL AND json_type(payload, ?) != 'null'
+        ''', (post_id, path, path))
+        histogram = {"answered": cursor.fetchone()[0]}
+        kind = question["kind"]
+
+        if kind in ("rating", "choice"):
+            # JSON booleans come back from json_extract as 0/1, so keep them apart from numbers
+            cursor.execute('''
+                SELECT CASE json_type(payload, ?) WHEN 'true' THEN 'true' WHEN 'false' THEN 'false'
+                    ELSE json_extract(payload, ?) END AS answer, COUNT(*)
+                FROM responses
+                WHERE post_id = ? AND answer IS NOT NULL
+                GROUP BY answer
+            ''', (path, path, post_id))
+            histogram["values"] = dict(cursor.fetchall())
+        elif kind == "multichoice":
+            cursor.execute('''
+                SELECT answer.value, COUNT(*) FROM responses, json_each(responses.payload, ?) AS answer
+                WHERE responses.post_id = ? AND answer.value IS NOT NULL
+                GROUP BY answer.value
+            ''', (path, post_id))
+            histogram["values"] = dict(cursor.fetchall())
+        elif kind in ("matrix", "items"):
+            # Items of a multiple-text question are free text, so only answered counts are kept
+            answer_column = "answer.value" if kind == "matrix" else "NULL"
+            cursor.execute(f'''
+                SELECT answer.key, {answer_column}, COUNT(*)
+                FROM responses, json_each(responses.payload, ?) AS answer
+                WHERE responses.post_id = ? AND json_type(responses.payload, ?) = 'object'
+                    AND answer.value IS NOT NULL
+                GROUP BY 1, 2
+            ''', (path, post_id, path))
+            rows = {}
+            for row, answer, count in cursor.fetchall():
+                rows.setdefault(row, {})[answer] = count
+            histogram["rows"] = rows
+        histograms[question["name"]] = histogram
+    return histograms
+
+def extracted_answer(value: Any) -> Any:
+    """An answer as the json_extract query in sql_histograms returns it"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+    return value
+
+def each_answer(value: Any) -> Any:
+    """An answer as json_each returns it (booleans become 0/1)"""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+    return value
+
+def answer_histograms(questions: List[Dict[str, Any]], results: List[Any]) -> Dict[str, Dict[str, Any]]:
+    """Histograms of decoded results, counted exactly like sql_histograms counts stored rows"""
+    histograms = {}
+    for question in questions:
+        name = question["name"]
+        if json_path(name) is None:
+            continue
+        kind = question["kind"]
+        histogram = {"answered": 0}
+        if kind in ("rating", "choice", "multichoice"):
+            histogram["values"] = {}
+        elif kind in ("matrix", "items"):
+            histogram["rows"] = {}
+        for result in results:
+            value = result.get(name) if isinstance(result, dict) else None
+            if value is None:
+                continue
+            histogram["answered"] += 1
+            if kind in ("rating", "choice"):
+                answer = extracted_answer(value)
+                histogram["values"][answer] = histogram["values"].get(answer, 0) + 1
+            elif kind == "multichoice":
+                items = value if isinstance(value, list) else value.values() if isinstance(value, dict) else [value]
+                for item in items:
+                    if item is None:
+                        continue
+                    answer = each_answer(item)
+                    histogram["values"][answer] = histogram["values"].get(answer, 0) + 1
+            elif kind in ("matrix", "items") and isinstance(value, dict):
+                for row, item in value.items():
+                    if item is None:
+                        continue
+                    answer = each_answer(item) if kind == "matrix" else None
+                    counts = histogram["rows"].setdefault(row, {})
+                    counts[answer] = counts.get(answer, 0) + 1
+        histograms[name] = histogram
+    return histograms
+
+def counter_rows(histograms: Dict[str, Dict[str, Any]]) -> tuple:
+    """Flatten histograms into (question, answered) and (question, row, answer, count) rows"""
+    questions = []
+    answers = []
+    for name, histogram in histograms.items():
+        questions.append((name, histogram["answered"]))
+        for answer, count in histogram.get("values", {}).items():
+            answers.append((name, "", answer, count))
+        for row, counts in histogram.get("rows", {}).items():
+            for answer, count in counts.items():
+                # Free-text items have no answer value to count
+                answers.append((name, row, "" if answer is None else answer, count))
+    return questions, answers
+
+def merge_counts(choices: List[Any], values: Dict[Any, int]) -> Dict[str, int]:
+    """Counts keyed by answer text, listing every defined choice even if never picked"""
+    counts = {}
+    for choice in choices:
+        counts[answer_key(choice)] = 0
+    for answer, count in values.items():
+        key = answer_key(answer)
+        counts[key] = counts.get(key, 0) + count
+    return counts
+
+def answer_key(answer: Any) -> str:
+    """Answers such as 5 and "5" are the same choice"""
+    if isinstance(answer, bool):
+        return "true" if answer else "false"
+    if isinstance(answer, float) and answer.is_integer():
+        answer = int(answer)
+    return str(answer)
+
+def histogram_percentile(points: List[tuple], total: int, q: float) -> float:
+    """Linearly interpolated percentile of sorted (value, count) points"""
+    position = (total - 1) * q / 100.0
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    lower_value = upper_value = None
+    seen = 0
+    for value, count in points:
+        if lower_value is None and lower < seen + count:
+            lower_value = value
+        if upper < seen + count:
+            upper_value = value
+            break
+        seen += count
+    return lower_value + (upper_value - lower_value) * (position - lower)
+
+def rating_statistics(values: Dict[Any, int]) -> Dict[str, Any]:
+    """Mean, median, percentiles and range of numeric answers"""
+    numeric = {}
+    for answer, count in values.items():
+        try:
+            number = float(answer)
+        except (TypeError, ValueError):
+            continue
+        numeric[number] = numeric.get(number, 0) + count
+    total = sum(numeric.values())
+    if not total:
+        statistics = {"mean": None, "median": None, "min": None, "max": None}
+        statistics.update({f"p{q}": None for q in PERCENTILES})
+        return statistics
+    points = sorted(numeric.items())
+    statistics = {
+        "mean": sum(value * count for value, count in points) / total,
+        "median": histogram_percentile(points, total, 50),
+        "min": points[0][0],
+        "max": points[-1][0],
+    }
+    for q in PERCENTILES:
+        statistics[f"p{q}"] = histogram_percentile(points, total, q)
+    return statistics
+
+def summarize(questions: List[Dict[str, Any]], histograms: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Turn per-question histograms into the statistics returned by the API"""
+    summary = []
+    for question in questions:
+        histogram = histograms.get(question["name"])
+        if histogram is None:
+            continue
+        kind = question["kind"]
+        entry = {"name": question["name"], "type": question["type"], "answered": histogram["answered"]}
+        if kind in ("rating", "choice", "multichoice"):
+            entry["counts"] = merge_counts(question["choices"], histogram.get("values", {}))
+            if kind == "rating":
+                entry.update(rating_statistics(histogram.get("values", {})))
+        elif kind == "matrix":
+            rows = histogram.get("rows", {})
+            entry["rows"] = {}
+            for row in question["rows"] + [row for row in rows if row not in question["rows"]]:
+                values = rows.get(row, {})
+                entry["rows"][answer_key(row)] = {
+                    "answered": sum(values.values()),
+                    "counts": merge_counts(question["choices"], values)
+                }
+        elif kind == "items":
+            rows = histogram.get("rows", {})
+            entry["items"] = {}
+            for item in question["rows"] + [item for item in rows if item not in question["rows"]]:
+                entry["items"][answer_key(item)] = {"answered": sum(rows.get(item, {}).values())}
+        summary.append(entry)
+    return summary
@@ -0,0 +1,123 @@
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Callable, AsyncIterator
+from storage import SurveyStorage
+from profiling import current_trace, run_traced
+
+class AsyncSQLiteDBAdapter:
+    """Async facade that keeps storage engine calls off the event loop"""
+
+    def __init__(self, adapter: SurveyStorage, max_workers: int = 4):
+        self.adapter = adapter
+        self.max_workers = max_workers
+        # max_workers = 0 runs every call inline on the event loop (legacy behaviour)
+        self.executor = None
+        if max_workers > 0:
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="surveyjs-db")
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """Run a blocking database call on the executor and await its result"""
+        if self.executor is None:
+            return run_traced(func, None, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        # Carry context variables (including the profiling trace) over to the worker thread
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, run_traced, func, time.perf_counter(), *args, **kwargs)
+        return await loop.run_in_executor(self.executor, call)
+
+    async def run_in_transaction(self, func: Callable, *args, **kwargs):
+        """Run func(adapter, ...) on one pooled connection inside a single transaction"""
+        def call():
+            with self.adapter.transaction():
+                return func(self.adapter, *args, **kwargs)
+        return await self.run(call)
+
+    def shutdown_executor(self):
+        """Wait for pending calls and stop the executor"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+    def close(self):
+        """Stop the executor and close the storage engine"""
+        self.shutdown_executor()
+        self.adapter.close()
+
+    async def get_surveys(self, fields: Optional[List[str]] = None, limit: Optional[int] = None,
+                          after: Optional[str] = None, name_prefix: Optional[str] = None) -> List[Dict[str, Any]]:
+        return await self.run(self.adapter.get_surveys, fields, limit, after, name_prefix)
+
+    async def get_survey(self, survey_id: str) -> Optional[Dict[str, Any]]:
+        return await self.run(self.adapter.get_survey, survey_id)
+
+    async def get_survey_entry(self, survey_id: str) -> Optional[Dict[str, Any]]:
+        return await self.run(self.adapter.get_survey_entry, survey_id)
+
+    async def get_catalog_version(self) -> int:
+        return await self.run(self.adapter.get_catalog_version)
+
+    async def add_survey(self, name: Optional[str] = None) -> Dict[str, Any]:
+        return await self.run(self.adapter.add_survey, name)
+
+    async def change_name(self, survey_id: str, name: str) -> Optional[Dict[str, Any]]:
+        return await self.run(self.adapter.change_name, survey_id, name)
+
+    async def store_survey(self, survey_id: str, name: Optional[str], json_data: Optional[str],
+                           base_version: Optional[int] = None) -> Dict[str, Any]:
+        return await self.run(self.adapter.store_survey, survey_id, name, json_data, base_version)
+
+    async def patch_survey(self, survey_id: str, operations: List[Any], base_version: int) -> Optional[Dict[str, Any]]:
+        return await self.run(self.adapter.patch_survey, survey_id, operations, base_version)
+
+    async def get_revisions(self, survey_id: str) -> List[Dict[str, Any]]:
+        return await self.run(self.adapter.get_revisions, survey_id)
+
+    async def get_revision(self, survey_id: str, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        return await self.run(self.adapter.get_revision, survey_id, version)
+
+    async def delete_survey(self, survey_id: str) -> Optional[Dict[str, Any]]:
+        return await self.run(self.adapter.delete_survey, survey_id)
+
+    async def post_results(self, post_id: str, survey_result: Dict[str, Any],
+                           submission_id: Optional[str] = None) -> Dict[str, Any]:
+        if self.adapter.writer is not None:
+            # Wait for the group commit without tying up an executor thread
+            started = time.perf_counter()
+            await asyncio.wrap_future(self.adapter.submit_results(post_id, survey_result, submission_id))
+            trace = current_trace.get()
+            if trace is not None:
+                # Includes waiting for batches queued ahead of this one
+                trace.add_span("storage.group_commit", time.perf_counter() - started)
+            return {}
+        return await self.run(self.adapter.post_results, post_id, survey_result, submission_id)
+
+    async def post_results_batch(self, records: List[Any]) -> List[Dict[str, Any]]:
+        return await self.run(self.adapter.post_results_batch, records)
+
+    async def get_results(self, post_id: str) -> Optional[Dict[str, Any]]:
+        return await self.run(self.adapter.get_results, post_id)
+
+    async def get_results_page(self, post_id: str, limit: int, after: Optional[int] = None) -> Dict[str, Any]:
+        return await self.run(self.adapter.get_results_page, post_id, limit, after)
+
+    async def get_results_json(self, post_id: str) -> Optional[bytes]:
+        return await self.run(self.adapter.get_results_json, post_id)
+
+    async def get_results_page_json(self, post_id: str, limit: int, after: Optional[int] = None) -> Optional[bytes]:
+        return await self.run(self.adapter.get_results_page_json, post_id, limit, after)
+
+    async def get_statistics(self, post_id: str) -> Optional[Dict[str, Any]]:
+        return await self.run(self.adapter.get_statistics, post_id)
+
+    async def iter_response_rows(self, post_id: str, batch_size: int = 1000) -> AsyncIterator[List[tuple]]:
+        """Yield batches of response rows, reading each batch on the executor"""
+        after = None
+        while True:
+            rows = await self.run(self.adapter.get_response_rows, post_id, after, batch_size)
+            if rows:
+                yield rows
+            if len(rows) < batch_size:
+                return
+            after = rows[-1][0]
@@ -0,0 +1,100 @@
+"""p99 latency of /api/getSurvey while large /api/results reads run concurrently.
+
+Runs the FastAPI app in-process over httpx's ASGI transport and compares the
+legacy inline mode (database calls on the event loop) with the thread-pool
+facade. Prints one JSON document per mode.
+
+    python benchmarks/async_latency.py --responses 50000 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from common import percentile, load_service
+
+import httpx
+
+
+def seed(adapter, post_id, count):
+    answer = json.dumps({"Quality": {"affordable": "3", "does what it claims": "4"},
+                         "satisfaction": 4, "suggestions": "x" * 200})
+    with adapter.get_connection() as conn:
+        conn.executemany(
+            'INSERT INTO responses (post_id, created_at, payload) VALUES (?, ?, ?)',
+            ((post_id, time.time(), answer) for _ in range(count)))
+        conn.commit()
+
+
+async def measure(app, duration, export_reads, interval):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        latencies = []
+        stop = asyncio.Event()
+
+        async def exports():
+            # Let the fetch loop get going before the large reads start
+            await asyncio.sleep(0.1)
+            for _ in range(export_reads):
+                response = await client.get("/api/results", params={"postId": "bench"})
+                response.raise_for_status()
+            stop.set()
+
+        async def fetch(scheduled):
+            response = await client.get("/api/getSurvey", params={"surveyId": "1"})
+            response.raise_for_status()
+            # Measured from the scheduled start so event-loop stalls are counted
+            latencies.append((time.perf_counter() - scheduled) * 1000.0)
+
+        async def fetches():
+            # Open-loop arrivals: one request every interval, whether or not the loop is free
+            started = time.perf_counter()
+            tasks = []
+            i = 0
+            while not stop.is_set() and time.perf_counter() - started < duration:
+                scheduled = started + i * interval
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(fetch(scheduled)))
+                i += 1
+            await asyncio.gather(*tasks)
+
+        await asyncio.gather(exports(), fetches())
+        return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--responses", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--exports", type=int, default=3)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--interval", type=float, default=5.0, help="ms between getSurvey requests")
+    args = parser.parse_args()
+
+    service = load_service()
+    from asyncdbadapter import AsyncSQLiteDBAdapter
+
+    adapter = service.db_adapter.adapter
+    seed(adapter, "bench", args.responses)
+
+    for mode, workers in (("inline", 0), ("executor", args.workers)):
+        facade = AsyncSQLiteDBAdapter(adapter, max_workers=workers)
+        service.db_adapter = facade
+        latencies = asyncio.run(measure(service.app, args.duration, args.exports, args.interval / 1000.0))
+        facade.shutdown_executor()
+        print(json.dumps({
+            "benchmark": "getSurvey_during_results_export",
+            "mode": mode,
+            "workers": workers,
+            "responses": args.responses,
+            "requests": len(latencies),
+            "p50_ms": percentile(latencies, 50),
+            "p99_ms": percentile(latencies, 99),
+            "max_ms": max(latencies) if latencies else None,
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Ingest throughput: one /api/post per answer versus /api/postBatch uploads.
+
+Runs the FastAPI app in-process over httpx's ASGI transport and prints one
+JSON document per mode.
+
+    python benchmarks/batch_ingest.py --records 20000 --batch-size 200
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from common import load_service
+
+import httpx
+
+ANSWER = {"Quality": {"affordable": "3", "does what it claims": "4"},
+          "satisfaction": 4, "price": "correct", "suggestions": "Faster checkout"}
+
+
+async def single_posts(client, records, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def post(i):
+        async with semaphore:
+            response = await client.post("/api/post", json={
+                "postId": "single", "surveyResult": ANSWER, "submissionId": f"single-{i}"})
+            response.raise_for_status()
+
+    await asyncio.gather(*(post(i) for i in range(records)))
+
+
+async def batch_posts(client, records, batch_size, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def post(start):
+        body = "\n".join(json.dumps({"postId": "batch", "surveyResult": ANSWER, "submissionId": f"batch-{i}"})
+                         for i in range(start, min(start + batch_size, records)))
+        async with semaphore:
+            response = await client.post("/api/postBatch", content=body,
+                                         headers={"content-type": "application/x-ndjson"})
+            response.raise_for_status()
+
+    await asyncio.gather(*(post(start) for start in range(0, records, batch_size)))
+
+
+async def run(app, mode, args):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        if mode == "single":
+            await single_posts(client, args.records, args.concurrency)
+        else:
+            await batch_posts(client, args.records, args.batch_size, args.concurrency)
+        return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    service = load_service()
+    for mode in ("single", "batch"):
+        elapsed = asyncio.run(run(service.app, mode, args))
+        print(json.dumps({
+            "benchmark": "result_ingest",
+            "mode": mode,
+            "records": args.records,
+            "batch_size": args.batch_size if mode == "batch" else 1,
+            "seconds": elapsed,
+            "records_per_second": args.records / elapsed,
+        }))
+    service.db_adapter.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Survey cache coherence across serve.py workers, and what the check costs per read.
+
+Starts serve.py with several workers and a one-hour survey cache TTL, so
+only invalidation can make a worker drop a cached definition. It warms
+every worker's cache, then repeatedly changes a survey through one request
+(changeJson, changeName, delete) and immediately reads it back over new
+connections, which land on arbitrary workers. Every read after the change
+must see it. The run is repeated with the shared epoch file disabled, to
+show the check catches stale workers. Exits 1 if the enabled run served a
+stale definition, so the exit status is the coherence test; --check runs
+only that part.
+
+Also times SurveyCache.get hits with and without the epoch check.
+
+    python benchmarks/cache_coherence.py --workers 3 --rounds 20
+    python benchmarks/cache_coherence.py --check
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+from common import ROOT
+
+import httpx
+
+from sharedepochs import EpochTable
+from surveycache import SurveyCache
+
+
+def read_cost(epochs):
+    cache = SurveyCache(epochs=epochs)
+    cache.put("1", {"id": "1"}, cache.token("1"))
+    number = 200000
+    return timeit.timeit(lambda: cache.get("1"), number=number) / number * 1e9
+
+
+def free_port():
+    """A port nothing listens on, for serve.py to bind"""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def wait_ready(base_url, server):
+    while True:
+        try:
+            if httpx.get(base_url + "/api/getActive", timeout=1).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if server.poll() is not None:
+            raise RuntimeError("serve.py exited before answering")
+        time.sleep(0.05)
+
+
+def fresh_get(base_url, path, params):
+    # A new connection per request, so the reads are spread over the workers
+    with httpx.Client(base_url=base_url) as client:
+        return client.get(path, params=params)
+
+
+def check(args, epoch_file):
+    workdir = tempfile.mkdtemp(prefix="surveyjs-bench-")
+    environ = dict(os.environ, SURVEYJS_DB_PATH=os.path.join(workdir, "bench.db"), SURVEYJS_SEED_DEMO="1",
+                   SURVEYJS_SURVEY_CACHE_TTL="3600", SURVEYJS_CACHE_EPOCH_FILE=epoch_file)
+    port = args.port or free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port), "--workers", str(args.workers)],
+        cwd=ROOT, env=environ, stderr=subprocess.DEVNULL)
+    stale = 0
+    reads = 0
+    try:
+        wait_ready(base_url, server)
+        for round_number in range(args.rounds):
+            survey_id = httpx.get(base_url + "/api/create").json()["id"]
+            for _ in range(args.reads):
+                fresh_get(base_url, "/api/getSurvey", {"surveyId": survey_id})
+            expected_json = json.dumps({"title": f"round {round_number}"})
+            httpx.post(base_url + "/api/changeJson", json={"id": survey_id, "json": expected_json})
+            httpx.get(base_url + "/api/changeName", params={"id": survey_id, "name": f"renamed {round_number}"})
+            for _ in range(args.reads):
+                survey = fresh_get(base_url, "/api/getSurvey", {"surveyId": survey_id}).json()
+                reads += 1
+                if survey.get("json") != expected_json or survey.get("name") != f"renamed {round_number}":
+                    stale += 1
+            httpx.get(base_url + "/api/delete", params={"id": survey_id})
+            for _ in range(args.reads):
+                reads += 1
+                if fresh_get(base_url, "/api/getSurvey", {"surveyId": survey_id}).status_code != 404:
+                    stale += 1
+    finally:
+        server.terminate()
+        server.wait()
+    return reads, stale
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--reads", type=int, default=12, help="reads per worker-warming and checking phase")
+    parser.add_argument("--port", type=int, default=0, help="default: a free port")
+    parser.add_argument("--check", action="store_true", help="only the coherence run with the epoch file")
+    args = parser.parse_args()
+
+    modes = [("epochs", os.path.join(tempfile.mkdtemp(prefix="surveyjs-bench-"), "epochs"))]
+    if not args.check:
+        path = os.path.join(tempfile.mkdtemp(prefix="surveyjs-bench-"), "epochs")
+        epochs = EpochTable(path)
+        print(json.dumps({"benchmark": "survey_cache_hit", "ns_without_epochs": read_cost(None),
+                          "ns_with_epochs": read_cost(epochs)}))
+        epochs.close()
+        modes.append(("no_epochs", ""))
+
+    failed = False
+    for label, epoch_file in modes:
+        reads, stale = check(args, epoch_file)
+        print(json.dumps({"benchmark": "cache_coherence", "mode": label, "workers": args.workers,
+                          "reads": reads, "stale_reads": stale}))
+        failed = failed or (label == "epochs" and stale > 0)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""Columnar export of a large post: throughput, file size and peak memory per batch size.
+
+Seeds one post with demo responses, then writes it to Parquet and Arrow IPC
+with write_columnar at several batch sizes. Peak memory is the Python heap
+(tracemalloc) plus Arrow's memory pool, and should depend on the batch size
+only, not on the number of responses. Needs pyarrow.
+
+    python benchmarks/columnar_export.py --responses 200000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from common import load_service
+
+from columnarexport import write_columnar
+from demo_surveys import demo_data
+from surveyschema import load_survey_json
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--responses", type=int, default=200000)
+    parser.add_argument("--batch-sizes", default="1000,10000,50000")
+    args = parser.parse_args()
+    try:
+        import pyarrow
+    except ImportError:
+        sys.exit("pyarrow required: pip install pyarrow")
+
+    service = load_service(SURVEYJS_METRICS="0")
+    adapter = service.db_adapter.adapter
+    post_id = "1"
+    answers = [answer for result in demo_data["results"] for answer in result["data"]]
+    for start in range(0, args.responses, 1000):
+        adapter.post_results_batch([{"postId": post_id, "surveyResult": answers[i % len(answers)]}
+                                    for i in range(start, min(start + 1000, args.responses))])
+    survey = load_survey_json(adapter.get_survey(post_id)["json"])
+    workdir = tempfile.mkdtemp(prefix="surveyjs-bench-")
+
+    for export_format in ("parquet", "arrow"):
+        for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+            path = os.path.join(workdir, f"results-{batch_size}.{export_format}")
+            tracemalloc.start()
+            pool_before = pyarrow.default_memory_pool().max_memory() or 0
+            started = time.perf_counter()
+            count = write_columnar(path, export_format, survey, adapter.iter_response_rows(post_id, batch_size))
+            seconds = time.perf_counter() - started
+            python_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(json.dumps({
+                "benchmark": "columnar_export",
+                "format": export_format,
+                "batch_size": batch_size,
+                "responses": count,
+                "rows_per_second": count / seconds,
+                "file_bytes": os.path.getsize(path),
+                "python_peak_bytes": python_peak,
+                "arrow_peak_bytes": max(0, (pyarrow.default_memory_pool().max_memory() or 0) - pool_before),
+            }))
+    service.db_adapter.close()
+
+
+if __name__ == "__main__":
+    main()
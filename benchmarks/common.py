@@ -0,0 +1,28 @@
+"""Helpers shared by the benchmark scripts."""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def load_service(**environ):
+    """Import main against a fresh demo-seeded database in a temporary directory and open it"""
+    workdir = tempfile.mkdtemp(prefix="surveyjs-bench-")
+    os.environ["SURVEYJS_DB_PATH"] = os.path.join(workdir, "bench.db")
+    os.environ["SURVEYJS_SEED_DEMO"] = "1"
+    os.environ.update({key: str(value) for key, value in environ.items()})
+    import main
+    # ASGI transports do not run the lifespan hook that normally opens the database
+    main.open_database()
+    return main
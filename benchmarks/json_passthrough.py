@@ -0,0 +1,102 @@
+"""Large /api/results bodies: parse and re-encode versus raw payload passthrough.
+
+Seeds one post with many responses, then times building the full results
+body three ways from the same stored rows:
+
+  stdlib       json.loads per row, FastAPI's jsonable_encoder, json.dumps (the old path)
+  orjson       jsonutil.loads per row and jsonutil.dumps_bytes, no jsonable_encoder
+  passthrough  stored payload text spliced into the body unparsed (what /api/results does now)
+
+and finally times the /api/results endpoint end to end over ASGI. Prints one
+JSON document per variant.
+
+    python benchmarks/json_passthrough.py --responses 100000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from common import percentile, load_service
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+
+import jsonutil
+from demo_surveys import demo_data
+
+
+def stdlib_body(post_id, rows):
+    content = {"id": post_id, "data": [json.loads(row[2]) for row in rows]}
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def orjson_body(post_id, rows):
+    return jsonutil.dumps_bytes({"id": post_id, "data": [jsonutil.loads(row[2]) for row in rows]})
+
+
+def passthrough_body(post_id, rows):
+    return jsonutil.raw_object({"id": jsonutil.dumps(post_id), "data": jsonutil.join_array(row[2] for row in rows)})
+
+
+def timed(build, post_id, rows, repeat):
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = build(post_id, rows)
+        seconds.append(time.perf_counter() - started)
+    return seconds, len(body)
+
+
+async def endpoint(app, post_id, repeat):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        seconds = []
+        size = 0
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = await client.get("/api/results", params={"postId": post_id})
+            response.raise_for_status()
+            seconds.append(time.perf_counter() - started)
+            size = len(response.content)
+        return seconds, size
+
+
+def report(variant, args, seconds, size):
+    return {
+        "benchmark": "results_json",
+        "variant": variant,
+        "orjson": jsonutil.orjson is not None,
+        "responses": args.responses,
+        "body_bytes": size,
+        "median_ms": percentile(seconds, 50) * 1000,
+        "max_ms": max(seconds) * 1000,
+        "megabytes_per_second": size / percentile(seconds, 50) / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--responses", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    service = load_service(SURVEYJS_METRICS="0")
+    adapter = service.db_adapter.adapter
+    post_id = "bench"
+    answers = [answer for result in demo_data["results"] for answer in result["data"]]
+    for start in range(0, args.responses, 1000):
+        adapter.post_results_batch([{"postId": post_id, "surveyResult": answers[i % len(answers)]}
+                                    for i in range(start, min(start + 1000, args.responses))])
+    rows = [row for batch in adapter.iter_response_rows(post_id, 10000) for row in batch]
+
+    for variant, build in (("stdlib", stdlib_body), ("orjson", orjson_body), ("passthrough", passthrough_body)):
+        seconds, size = timed(build, post_id, rows, args.repeat)
+        print(json.dumps(report(variant, args, seconds, size)))
+    seconds, size = asyncio.run(endpoint(service.app, post_id, args.repeat))
+    print(json.dumps(report("endpoint", args, seconds, size)))
+    service.db_adapter.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Stored result size and throughput: JSON text versus dictionary-coded binary payloads.
+
+Writes the same responses (cycled from the demo results, padded with a few
+extra questions so payloads look like real surveys) into one database per
+format and reports:
+
+  payload_bytes_per_row  average stored payload size
+  database_bytes         file size after VACUUM
+  write_rows_per_second  post_results_batch in batches of 1000
+  get_results_ms         decoded results (what statistics and counters read)
+  get_results_json_ms    the /api/results body
+
+    python benchmarks/result_format.py --responses 50000
+"""
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+from common import percentile
+
+from demo_surveys import demo_data
+from sqlitedbadapter import SQLiteDBAdapter
+
+VARIANTS = (
+    ("json", dict(result_format="json")),
+    ("binary", dict(result_format="binary")),
+    ("binary+zlib", dict(result_format="binary", result_compression=6)),
+)
+
+
+def answers(count):
+    demo = [answer for result in demo_data["results"] for answer in result["data"]]
+    for i in range(count):
+        answer = dict(demo[i % len(demo)])
+        answer.update({
+            "recommend_to_friend": i % 11,
+            "contact_preference": ["email", "phone"][: i % 3],
+            "comments": f"Response number {i}",
+        })
+        yield answer
+
+
+def timed(func, repeat):
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - started)
+    return percentile(seconds, 50) * 1000
+
+
+def run(variant, options, args):
+    path = os.path.join(tempfile.mkdtemp(prefix="surveyjs-bench-"), "bench.db")
+    adapter = SQLiteDBAdapter(path, **options)
+    post_id = "bench"
+    records = [{"postId": post_id, "surveyResult": answer} for answer in answers(args.responses)]
+    started = time.perf_counter()
+    for start in range(0, len(records), 1000):
+        adapter.post_results_batch(records[start:start + 1000])
+    write_seconds = time.perf_counter() - started
+
+    with adapter.get_connection() as conn:
+        stored = conn.execute('SELECT SUM(length(payload)) FROM responses WHERE post_id = ?', (post_id,)).fetchone()[0]
+    get_results_ms = timed(lambda: adapter.get_results(post_id), args.repeat)
+    get_results_json_ms = timed(lambda: adapter.get_results_json(post_id), args.repeat)
+    adapter.close()
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('VACUUM')
+    conn.close()
+    return {
+        "benchmark": "result_format",
+        "variant": variant,
+        "responses": args.responses,
+        "payload_bytes_per_row": stored / args.responses,
+        "database_bytes": os.path.getsize(path),
+        "write_rows_per_second": args.responses / write_seconds,
+        "get_results_ms": get_results_ms,
+        "get_results_json_ms": get_results_json_ms,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--responses", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    for variant, options in VARIANTS:
+        print(json.dumps(run(variant, options, args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Cost of checking posted results against their survey definition.
+
+Compiles the demo surveys into validators and reports:
+
+  compile_us        building a validator from a stored definition (paid once
+                    per survey version)
+  validate_us       checking one demo result in "strip" and "reject" mode
+  post_*_per_second /api/post throughput in-process over ASGI with validation
+                    off, strip and reject
+
+    python benchmarks/result_validation.py --posts 5000
+"""
+import argparse
+import asyncio
+import json
+import time
+import timeit
+
+from common import load_service
+
+import httpx
+
+from demo_surveys import demo_data
+from resultvalidation import ResultValidator
+from surveyschema import load_survey_json
+
+
+def micro(args):
+    for survey in demo_data["surveys"]:
+        definition = json.dumps(survey["json"])
+        results = [result for entry in demo_data["results"] if entry["id"] == survey["id"]
+                   for result in entry["data"]]
+        if not results:
+            continue
+        compile_seconds = timeit.timeit(lambda: ResultValidator(load_survey_json(definition)), number=args.number // 10)
+        validator = ResultValidator(load_survey_json(definition))
+        report = {"benchmark": "result_validation", "survey": survey["id"],
+                  "compile_us": compile_seconds / (args.number // 10) * 1e6}
+        for mode in ("strip", "reject"):
+            seconds = timeit.timeit(lambda: [validator.validate(result, mode) for result in results],
+                                    number=args.number // len(results))
+            report[f"validate_{mode}_us"] = seconds / (args.number // len(results) * len(results)) * 1e6
+        print(json.dumps(report))
+
+
+async def post_rate(service, posts):
+    result = next(entry["data"][0] for entry in demo_data["results"] if entry["id"] == "1")
+    transport = httpx.ASGITransport(app=service.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        for _ in range(posts):
+            response = await client.post("/api/post", json={"postId": "1", "surveyResult": result})
+            assert response.status_code == 200, response.text
+        return posts / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=100000, help="validations per timing")
+    parser.add_argument("--posts", type=int, default=3000)
+    args = parser.parse_args()
+
+    micro(args)
+    rates = {}
+    service = load_service()
+    try:
+        for mode in ("off", "strip", "reject"):
+            # Read on every request, so the mode can be switched without reloading the app
+            service.RESULT_VALIDATION = mode
+            rates[f"post_{mode}_per_second"] = asyncio.run(post_rate(service, args.posts))
+    finally:
+        service.close_database()
+    print(json.dumps({"benchmark": "result_validation_post", "posts": args.posts, **rates}))
+
+
+if __name__ == "__main__":
+    main()
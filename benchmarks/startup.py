@@ -0,0 +1,86 @@
+"""Cold start: time from launching uvicorn until the first request is answered.
+
+Each run starts `uvicorn main:app` in a fresh process and polls
+/api/getActive until it answers 200. Scenarios:
+
+  empty     new database file, no demo data
+  seeded    new database file with SURVEYJS_SEED_DEMO=1
+  existing  database created by an earlier run (schema already current)
+
+Also reports how long `import main` takes on its own.
+
+    python benchmarks/startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT, percentile
+
+import httpx
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def first_request_seconds(environ):
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=environ)
+    try:
+        while True:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/api/getActive", timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+            if server.poll() is not None:
+                raise RuntimeError("Server exited before answering")
+            time.sleep(0.005)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def import_seconds(environ):
+    code = "import time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+    return float(subprocess.check_output([sys.executable, "-c", code], cwd=ROOT, env=environ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="surveyjs-bench-")
+    environ = dict(os.environ, SURVEYJS_DB_PATH=os.path.join(workdir, "existing.db"))
+    timings = {"import": [import_seconds(environ) for _ in range(args.runs)]}
+    for scenario in ("empty", "seeded", "existing"):
+        timings[scenario] = []
+        for run in range(args.runs):
+            path = os.path.join(workdir, "existing.db" if scenario == "existing" else f"{scenario}-{run}.db")
+            timings[scenario].append(first_request_seconds(
+                dict(environ, SURVEYJS_DB_PATH=path, SURVEYJS_SEED_DEMO="1" if scenario == "seeded" else "0")))
+
+    for scenario, seconds in timings.items():
+        print(json.dumps({
+            "benchmark": "startup",
+            "scenario": scenario,
+            "runs": args.runs,
+            "median_ms": percentile(seconds, 50) * 1000,
+            "max_ms": max(seconds) * 1000,
+        }))
+
+
+if __name__ == "__main__":
+    main()
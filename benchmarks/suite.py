@@ -0,0 +1,198 @@
+"""Benchmark suite: survey fetch storms, concurrent posting and large exports.
+
+Runs the FastAPI app in-process over httpx's ASGI transport (no network)
+with requests built from demo_surveys.py, and prints one JSON document with
+throughput, latency percentiles and the peak RSS after each workload. Pass
+--baseline with an earlier run to exit 1 when throughput drops by more than
+--tolerance.
+
+    python benchmarks/suite.py --output bench.json
+    python benchmarks/suite.py --baseline bench.json --tolerance 0.15
+    SURVEYJS_STORAGE=memory python benchmarks/suite.py --workloads fetch_storm
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+
+from common import percentile, load_service
+
+import httpx
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from demo_surveys import demo_data
+
+WORKLOADS = ("fetch_storm", "concurrent_post", "large_export")
+
+
+def peak_rss_kb():
+    """High-water mark of this process's resident set size"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def summary(name, latencies, elapsed, **extra):
+    report = {
+        "workload": name,
+        "requests": len(latencies),
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed if elapsed else None,
+        "latency_ms": {f"p{q}": percentile(latencies, q) * 1000 for q in (50, 90, 99)},
+        "peak_rss_kb": peak_rss_kb(),
+    }
+    report["latency_ms"]["max"] = max(latencies) * 1000
+    report.update(extra)
+    return report
+
+
+async def drive(count, concurrency, request):
+    """Run request(i) count times, at most concurrency at once; return latencies and wall time"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await request(i)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return latencies, time.perf_counter() - started
+
+
+async def fetch_storm(client, args):
+    """Many clients opening the demo surveys at once, with the occasional list refresh"""
+    survey_ids = [survey["id"] for survey in demo_data["surveys"]]
+
+    async def request(i):
+        if i % 10 == 9:
+            response = await client.get("/api/getActive")
+        else:
+            response = await client.get("/api/getSurvey", params={"surveyId": survey_ids[i % len(survey_ids)]},
+                                        headers={"accept-encoding": "gzip"})
+        response.raise_for_status()
+
+    latencies, elapsed = await drive(args.requests, args.concurrency, request)
+    return summary("fetch_storm", latencies, elapsed)
+
+
+async def concurrent_post(client, args):
+    """Concurrent /api/post submissions replaying the demo answers"""
+    answers = [(result["id"], answer) for result in demo_data["results"] for answer in result["data"]]
+
+    async def request(i):
+        post_id, answer = answers[i % len(answers)]
+        response = await client.post("/api/post", json={
+            "postId": post_id, "surveyResult": answer, "submissionId": f"suite-{i}"})
+        response.raise_for_status()
+
+    latencies, elapsed = await drive(args.requests, args.concurrency, request)
+    return summary("concurrent_post", latencies, elapsed)
+
+
+async def large_export(client, service, args):
+    """Full /api/results reads and streamed NDJSON/CSV exports of one large post"""
+    post_id = demo_data["results"][0]["id"]
+    answers = demo_data["results"][0]["data"]
+    # Seed straight through the storage engine; only the reads are timed
+    adapter = service.db_adapter.adapter
+    for start in range(0, args.export_rows, 1000):
+        adapter.post_results_batch([
+            {"postId": post_id, "surveyResult": answers[i % len(answers)]}
+            for i in range(start, min(start + 1000, args.export_rows))])
+
+    sizes = []
+    requests = [("/api/results", {"postId": post_id}),
+                ("/api/exportResults", {"postId": post_id, "format": "ndjson"}),
+                ("/api/exportResults", {"postId": post_id, "format": "csv"})]
+
+    async def request(i):
+        path, params = requests[i % len(requests)]
+        response = await client.get(path, params=params)
+        response.raise_for_status()
+        sizes.append(len(response.content))
+
+    latencies, elapsed = await drive(args.exports * len(requests), 1, request)
+    return summary("large_export", latencies, elapsed, rows=args.export_rows,
+                   megabytes_per_second=sum(sizes) / elapsed / 1e6)
+
+
+async def run(service, args):
+    transport = httpx.ASGITransport(app=service.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        reports = []
+        for name in args.workloads:
+            if name == "fetch_storm":
+                reports.append(await fetch_storm(client, args))
+            elif name == "concurrent_post":
+                reports.append(await concurrent_post(client, args))
+            else:
+                reports.append(await large_export(client, service, args))
+        return reports
+
+
+def regressions(reports, baseline, tolerance):
+    """Workloads whose throughput fell more than tolerance below the baseline run"""
+    previous = {report["workload"]: report for report in baseline["workloads"]}
+    found = []
+    for report in reports:
+        before = previous.get(report["workload"])
+        if before and report["requests_per_second"] < before["requests_per_second"] * (1 - tolerance):
+            found.append({"workload": report["workload"],
+                          "requests_per_second": report["requests_per_second"],
+                          "baseline": before["requests_per_second"]})
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workloads", default=",".join(WORKLOADS),
+                        help=f"comma-separated subset of {','.join(WORKLOADS)}")
+    parser.add_argument("--requests", type=int, default=5000, help="requests per fetch/post workload")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--export-rows", type=int, default=50000)
+    parser.add_argument("--exports", type=int, default=3, help="reads of each export format")
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--baseline", help="earlier report to compare throughput against")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+    args.workloads = [name.strip() for name in args.workloads.split(",") if name.strip()]
+    for name in args.workloads:
+        if name not in WORKLOADS:
+            parser.error(f"unknown workload: {name}")
+
+    service = load_service()
+    reports = asyncio.run(run(service, args))
+    service.db_adapter.close()
+
+    document = {
+        "benchmark": "suite",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "storage": os.environ.get("SURVEYJS_STORAGE", "sqlite"),
+        "workloads": reports,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            document["regressions"] = regressions(reports, json.load(f), args.tolerance)
+    text = json.dumps(document, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    return 1 if document.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""Autosaving a large survey: full JSON versus JSON Patch through /api/changeJson.
+
+Builds a multi-page survey by repeating the demo pages, then performs the
+same sequence of small edits (retitle a question, add one, remove one) as
+full-definition saves and as patches, in-process over ASGI. Reports per save:
+
+  request_bytes     body sent to /api/changeJson
+  save_ms           median time of a save
+  history_bytes     revision history stored for all the saves (versus
+                    full_copies_bytes for keeping every version whole)
+  get_revision_ms   median time to rebuild a definition from the history
+
+    python benchmarks/survey_patch.py --pages 200 --saves 200
+"""
+import argparse
+import asyncio
+import copy
+import json
+import time
+
+from common import load_service, percentile
+
+import httpx
+
+from demo_surveys import demo_data
+
+
+def large_survey(pages):
+    demo_pages = [page for survey in demo_data["surveys"] for page in survey["json"].get("pages", [])]
+    survey = {"title": "Large survey", "pages": []}
+    for number in range(pages):
+        page = copy.deepcopy(demo_pages[number % len(demo_pages)])
+        page["name"] = f"page{number}"
+        for element in page.get("elements", []):
+            element["name"] = f"{element['name']} {number}"
+        survey["pages"].append(page)
+    return survey
+
+
+def edit(survey, step):
+    """Apply one Creator-sized edit to survey in place and return it as a patch"""
+    page = step % len(survey["pages"])
+    elements = survey["pages"][page]["elements"]
+    if step % 3 == 0:
+        elements[0]["title"] = f"Edited {step}"
+        return [{"op": "add", "path": f"/pages/{page}/elements/0/title", "value": elements[0]["title"]}]
+    if step % 3 == 1:
+        question = {"type": "text", "name": f"added {step}", "title": "Added question"}
+        elements.append(question)
+        return [{"op": "add", "path": f"/pages/{page}/elements/-", "value": question}]
+    elements.pop()
+    return [{"op": "remove", "path": f"/pages/{page}/elements/{len(elements)}"}]
+
+
+async def run(service, args, mode):
+    survey = large_survey(args.pages)
+    transport = httpx.ASGITransport(app=service.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        survey_id = (await client.get("/api/create")).json()["id"]
+        response = await client.post("/api/changeJson", json={"id": survey_id, "json": json.dumps(survey)})
+        version = response.json()["version"]
+        sizes = []
+        seconds = []
+        for step in range(args.saves):
+            operations = edit(survey, step)
+            if mode == "patch":
+                body = {"id": survey_id, "baseVersion": version, "patch": operations}
+            else:
+                body = {"id": survey_id, "baseVersion": version, "json": json.dumps(survey)}
+            content = json.dumps(body).encode()
+            sizes.append(len(content))
+            started = time.perf_counter()
+            response = await client.post("/api/changeJson", content=content,
+                                         headers={"Content-Type": "application/json"})
+            seconds.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.text
+            version = response.json()["version"]
+        revisions = (await client.get("/api/getRevisions", params={"surveyId": survey_id})).json()
+        rebuild = []
+        for revision in revisions[:20]:
+            started = time.perf_counter()
+            response = await client.get("/api/getRevision",
+                                        params={"surveyId": survey_id, "version": revision["version"]})
+            rebuild.append(time.perf_counter() - started)
+            assert response.status_code == 200
+        latest = (await client.get("/api/getRevision", params={"surveyId": survey_id})).json()
+        assert json.loads(latest["json"]) == survey
+    return {
+        "benchmark": "survey_patch",
+        "mode": mode,
+        "definition_bytes": len(json.dumps(survey)),
+        "saves": args.saves,
+        "request_bytes": sum(sizes) / len(sizes),
+        "save_ms": percentile(seconds, 50) * 1000,
+        "history_bytes": sum(revision["bytes"] for revision in revisions),
+        "full_copies_bytes": len(json.dumps(survey)) * args.saves,
+        "get_revision_ms": percentile(rebuild, 50) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--saves", type=int, default=200)
+    args = parser.parse_args()
+
+    service = load_service()
+    try:
+        for mode in ("full", "patch"):
+            print(json.dumps(asyncio.run(run(service, args, mode))))
+    finally:
+        service.close_database()
+
+
+if __name__ == "__main__":
+    main()
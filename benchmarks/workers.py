@@ -0,0 +1,110 @@
+"""Throughput of serve.py with one worker versus several, over real HTTP.
+
+Starts serve.py against a fresh demo-seeded database for each worker count,
+then drives each endpoint for a fixed time from several client processes
+(so the load generator is not the bottleneck) and reports requests per
+second and latency percentiles. Run it on the machine you deploy to: the
+gain from extra workers is bounded by the cores left over for the clients.
+
+    python benchmarks/workers.py --workers 1,4 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT, percentile
+
+import httpx
+
+ENDPOINTS = {
+    "getSurvey": ("GET", "/api/getSurvey?surveyId=1", None),
+    "getActive": ("GET", "/api/getActive", None),
+    "post": ("POST", "/api/post", {"postId": "1", "surveyResult": {"satisfaction": 4, "price": "low"}}),
+    "statistics": ("GET", "/api/statistics?postId=1", None),
+}
+
+
+async def client_load(base_url, endpoint, concurrency, duration):
+    method, path, body = ENDPOINTS[endpoint]
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def loop():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = await client.request(method, path, json=body)
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def client_process(args):
+    return asyncio.run(client_load(*args))
+
+
+def wait_ready(base_url, server):
+    while True:
+        try:
+            if httpx.get(base_url + "/api/getActive", timeout=1).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if server.poll() is not None:
+            raise RuntimeError("serve.py exited before answering")
+        time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default=f"1,{max(2, os.cpu_count() or 1)}", help="worker counts to compare")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--clients", type=int, default=max(2, (os.cpu_count() or 2) // 2),
+                        help="load generator processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="connections per client process")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per endpoint")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    for workers in [int(count) for count in args.workers.split(",")]:
+        path = os.path.join(tempfile.mkdtemp(prefix="surveyjs-bench-"), "bench.db")
+        environ = dict(os.environ, SURVEYJS_DB_PATH=path, SURVEYJS_SEED_DEMO="1")
+        server = subprocess.Popen(
+            [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(args.port), "--workers", str(workers)],
+            cwd=ROOT, env=environ, stderr=subprocess.DEVNULL)
+        try:
+            wait_ready(base_url, server)
+            for endpoint in args.endpoints.split(","):
+                with multiprocessing.Pool(args.clients) as pool:
+                    results = pool.map(client_process, [(base_url, endpoint, args.concurrency, args.duration)]
+                                       * args.clients)
+                latencies = [latency for result in results for latency in result[0]]
+                print(json.dumps({
+                    "benchmark": "workers",
+                    "workers": workers,
+                    "endpoint": endpoint,
+                    "connections": args.clients * args.concurrency,
+                    "requests_per_second": len(latencies) / args.duration,
+                    "errors": sum(result[1] for result in results),
+                    "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+                    "p99_ms": percentile(latencies, 99) * 1000 if latencies else None,
+                }))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+from typing import List, Dict, Any, Optional, Iterable
+import jsonutil
+from aggregation import describe_questions
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# File formats write_columnar can produce
+COLUMNAR_FORMATS = ("parquet", "arrow")
+
+class Column:
+    """One flat column of a results table and where its values come from in a result
+
+    kind is "int", "float", "bool", "category" (dictionary-encoded strings),
+    "list" (list of strings) or "string". item picks a key inside an object
+    answer, e.g. the row of a matrix question.
+    """
+
+    def __init__(self, name: str, kind: str, key: str, item: Optional[str] = None):
+        self.name = name
+        self.kind = kind
+        self.key = key
+        self.item = item
+
+    def value(self, answers: Dict[str, Any]) -> Any:
+        value = answers.get(self.key)
+        if self.item is not None:
+            value = value.get(self.item) if isinstance(value, dict) else None
+        if value is None:
+            return None
+        if self.kind == "int":
+            return as_int(value)
+        if self.kind == "float":
+            return as_float(value)
+        if self.kind == "bool":
+            return value if isinstance(value, bool) else None
+        if self.kind == "list":
+            values = value if isinstance(value, list) else [value]
+            return [as_string(item) for item in values]
+        return as_string(value)
+
+def as_int(value: Any) -> Optional[int]:
+    # bool first: True is an int too
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    try:
+        return int(str(value))
+    except ValueError:
+        return None
+
+def as_float(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def as_string(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    return jsonutil.dumps(value)
+
+def rating_kind(choices: List[Any]) -> str:
+    # describe_questions lists no choices for a scale it cannot enumerate; keep its answers as given
+    if not choices:
+        return "category"
+    if all(isinstance(choice, int) and not isinstance(choice, bool) for choice in choices):
+        return "int"
+    if all(isinstance(choice, (int, float)) and not isinstance(choice, bool) for choice in choices):
+        return "float"
+    return "category"
+
+def column_schema(survey: Dict[str, Any]) -> List[Column]:
+    """Flat columns of a survey's results, one per question or per matrix row / multiple-text item"""
+    columns = []
+    for question in describe_questions(survey):
+        name = question["name"]
+        kind = question["kind"]
+        if kind == "rating":
+            columns.append(Column(name, rating_kind(question["choices"]), name))
+        elif kind == "choice":
+            columns.append(Column(name, "bool" if question["type"] == "boolean" else "category", name))
+        elif kind == "multichoice":
+            columns.append(Column(name, "list", name))
+        elif kind in ("matrix", "items"):
+            cell = "category" if kind == "matrix" else "string"
+            columns.extend(Column(f"{name}.{row}", cell, name, row) for row in question["rows"] if row is not None)
+        else:
+            columns.append(Column(name, "string", name))
+    return columns
+
+def column_values(columns: List[Column], rows: List[tuple]) -> Dict[str, List[Any]]:
+    """Column name -> values of a batch of (seq, created_at, payload) rows"""
+    values = {"seq": [], "created_at": []}
+    values.update((column.name, []) for column in columns)
+    for seq, created_at, payload in rows:
+        answers = jsonutil.loads(payload)
+        if not isinstance(answers, dict):
+            answers = {}
+        values["seq"].append(seq)
+        # Microseconds, the unit of the created_at timestamp column
+        values["created_at"].append(int(created_at * 1000000))
+        for column in columns:
+            values[column.name].append(column.value(answers))
+    return values
+
+def require_pyarrow():
+    if pyarrow is None:
+        raise RuntimeError("Columnar export needs pyarrow (pip install pyarrow)")
+
+def arrow_type(kind: str):
+    return {
+        "int": pyarrow.int64(),
+        "float": pyarrow.float64(),
+        "bool": pyarrow.bool_(),
+        "category": pyarrow.dictionary(pyarrow.int32(), pyarrow.string()),
+        "list": pyarrow.list_(pyarrow.string()),
+        "string": pyarrow.string(),
+    }[kind]
+
+def arrow_schema(columns: List[Column]):
+    require_pyarrow()
+    fields = [pyarrow.field("seq", pyarrow.int64(), nullable=False),
+              pyarrow.field("created_at", pyarrow.timestamp("us", tz="UTC"), nullable=False)]
+    fields += [pyarrow.field(column.name, arrow_type(column.kind)) for column in columns]
+    return pyarrow.schema(fields)
+
+def record_batch(schema, columns: List[Column], rows: List[tuple]):
+    """An Arrow record batch of response rows"""
+    values = column_values(columns, rows)
+    return pyarrow.RecordBatch.from_arrays(
+        [pyarrow.array(values[field.name], type=field.type) for field in schema], schema=schema)
+
+def write_columnar(path: str, export_format: str, survey: Dict[str, Any], batches: Iterable[List[tuple]]) -> int:
+    """Write batches of response rows to a Parquet or Arrow IPC stream file; returns the row count
+
+    Only one batch is held in memory at a time. Each batch becomes a Parquet
+    row group or an IPC record batch, so the batch size also sets the unit
+    readers can skip or load on their own.
+    """
+    if export_format not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unknown columnar format: {export_format}")
+    columns = column_schema(survey)
+    schema = arrow_schema(columns)
+    if export_format == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(path, schema)
+    else:
+        # The stream format allows each batch its own category dictionary; the file format does not
+        writer = pyarrow.ipc.new_stream(path, schema)
+    count = 0
+    try:
+        for rows in batches:
+            writer.write_batch(record_batch(schema, columns, rows))
+            count += len(rows)
+    finally:
+        writer.close()
+    return count
@@ -0,0 +1,163 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+class StorageTuning:
+    """PRAGMA settings applied to every new connection"""
+
+    def __init__(self, journal_mode: Optional[str] = "WAL", synchronous: Optional[str] = "NORMAL",
+                 cache_size: Optional[int] = -20000, mmap_size: Optional[int] = 256 * 1024 * 1024,
+                 busy_timeout: Optional[int] = 5000):
+        # None leaves the SQLite default in place
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout
+
+    @classmethod
+    def from_env(cls, environ=os.environ) -> "StorageTuning":
+        """Build a profile from SURVEYJS_DB_PROFILE plus per-PRAGMA overrides"""
+        profile = environ.get("SURVEYJS_DB_PROFILE", "wal")
+        if profile not in TUNING_PROFILES:
+            raise ValueError(f"Unknown storage profile: {profile}")
+        base = TUNING_PROFILES[profile]
+        settings = {}
+        for name, convert in (("journal_mode", str), ("synchronous", str), ("cache_size", int),
+                              ("mmap_size", int), ("busy_timeout", int)):
+            value = environ.get(f"SURVEYJS_DB_{name.upper()}")
+            settings[name] = convert(value) if value else getattr(base, name)
+        return cls(**settings)
+
+    def apply(self, conn: sqlite3.Connection):
+        """Issue the configured PRAGMAs on a connection"""
+        # busy_timeout first so switching the journal mode waits for other writers
+        if self.busy_timeout is not None:
+            conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout)}')
+        if self.journal_mode is not None:
+            conn.execute(f'PRAGMA journal_mode = {self.journal_mode}')
+        if self.synchronous is not None:
+            conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        if self.cache_size is not None:
+            conn.execute(f'PRAGMA cache_size = {int(self.cache_size)}')
+        if self.mmap_size is not None:
+            conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+
+
+TUNING_PROFILES = {
+    # SQLite defaults: rollback journal, FULL sync
+    "default": StorageTuning(None, None, None, None, None),
+    # Readers never block the writer; commits fsync only at checkpoints
+    "wal": StorageTuning(),
+    # WAL with an fsync on every commit
+    "durable": StorageTuning(synchronous="FULL"),
+}
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections shared between threads"""
+
+    def __init__(self, db_path: str, size: int = 5, timeout: float = 30.0,
+                 health_check_interval: float = 30.0, tuning: Optional[StorageTuning] = None,
+                 factory: type = sqlite3.Connection):
+        self.db_path = db_path
+        self.tuning = tuning
+        # sqlite3.Connection subclass to create, e.g. one that traces statements
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        # LIFO keeps the most recently used (page-cache warm) connections busy
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a new connection that may be handed between threads"""
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False,
+                               factory=self.factory)
+        if self.tuning is not None:
+            self.tuning.apply(conn)
+        return conn
+
+    def _is_healthy(self, conn: sqlite3.Connection) -> bool:
+        """Check that an idle connection is still usable"""
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self) -> sqlite3.Connection:
+        """Take a connection from the pool, opening one if the pool is not full"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        try:
+            conn, released_at = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            try:
+                conn, released_at = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise sqlite3.OperationalError("Connection pool exhausted")
+
+        if time.monotonic() - released_at > self.health_check_interval and not self._is_healthy(conn):
+            conn.close()
+            conn = self._connect()
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection to the pool"""
+        if self._closed:
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put((conn, time.monotonic()))
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with block"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """Close idle connections; busy ones are closed when released"""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool occupancy"""
+        idle = self._idle.qsize()
+        return {
+            "size": self.size,
+            "open": self._created,
+            "idle": idle,
+            "in_use": self._created - idle
+        }
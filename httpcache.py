@@ -0,0 +1,161 @@
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Hashable
+from fastapi import Request
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Preferred first when the client accepts several
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=11)
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+class EncodedBody:
+    """A response body plus its compressed variants, each built at most once"""
+
+    def __init__(self, body: bytes):
+        self.identity = body
+        self._variants = {}
+        self._lock = threading.Lock()
+
+    def add_variant(self, encoding: str, content: bytes):
+        """Use an already compressed copy, e.g. a .gz/.br file built ahead of time"""
+        with self._lock:
+            self._variants[encoding] = content
+
+    def has_variant(self, encoding: Optional[str]) -> bool:
+        return encoding is None or encoding in self._variants
+
+    def variant(self, encoding: Optional[str]) -> bytes:
+        if encoding is None:
+            return self.identity
+        with self._lock:
+            if encoding not in self._variants:
+                self._variants[encoding] = compress(self.identity, encoding)
+            return self._variants[encoding]
+
+class BodyCache:
+    """LRU of EncodedBody objects keyed by content version"""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[EncodedBody]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return body
+
+    def put(self, key: Hashable, content: bytes) -> EncodedBody:
+        body = EncodedBody(content)
+        with self._lock:
+            self._entries[key] = body
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return body
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and occupancy"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None
+            }
+
+def negotiate_encoding(accept_encoding: str, size: int) -> Optional[str]:
+    """Pick the best supported content coding allowed by an Accept-Encoding header"""
+    if size < MIN_COMPRESS_SIZE or not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def etag_for(tag: str, encoding: Optional[str]) -> str:
+    """Strong ETag; each content coding is a distinct representation"""
+    return f'"{tag}-{encoding}"' if encoding else f'"{tag}"'
+
+def etag_matches(if_none_match: Optional[str], tag: str) -> bool:
+    """Whether If-None-Match names any representation of tag"""
+    if not if_none_match:
+        return False
+    candidates = {etag_for(tag, None)} | {etag_for(tag, encoding) for encoding in ENCODINGS}
+    for value in if_none_match.split(","):
+        value = value.strip()
+        if value == "*":
+            return True
+        if value.startswith("W/"):
+            value = value[2:]
+        if value in candidates:
+            return True
+    return False
+
+def not_modified(request: Request, body: EncodedBody, tag: str,
+                 headers: Optional[Dict[str, str]] = None) -> Optional[Response]:
+    """A 304 response if the client already holds version tag of body, else None"""
+    if not etag_matches(request.headers.get("if-none-match"), tag):
+        return None
+    headers = dict(headers or {})
+    # The ETag of the representation a 200 would send (RFC 9110 15.4.5)
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""), len(body.identity))
+    headers["ETag"] = etag_for(tag, encoding)
+    headers["Vary"] = "Accept-Encoding"
+    return Response(status_code=304, headers=headers)
+
+def encoded_response(request: Request, body: EncodedBody, tag: str, media_type: str = "application/json",
+                     headers: Optional[Dict[str, str]] = None) -> Response:
+    """Send the best cached variant of body that the client accepts"""
+    headers = dict(headers or {})
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""), len(body.identity))
+    headers["ETag"] = etag_for(tag, encoding)
+    headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body.variant(encoding), media_type=media_type, headers=headers)
+
+async def cached_response(request: Request, body: EncodedBody, tag: str, media_type: str = "application/json",
+                          headers: Optional[Dict[str, str]] = None) -> Response:
+    """not_modified or encoded_response, compressing a variant the first time on a worker thread"""
+    response = not_modified(request, body, tag, headers)
+    if response:
+        return response
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""), len(body.identity))
+    if not body.has_variant(encoding):
+        # gzip level 9 or brotli quality 11 of a large body would stall every other request on the loop
+        await run_in_threadpool(body.variant, encoding)
+    return encoded_response(request, body, tag, media_type, headers)
@@ -0,0 +1,53 @@
+import json
+from typing import Any, Dict, Iterable, Union
+from fastapi.responses import JSONResponse, Response
+from profiling import json_timer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps_bytes(value: Any) -> bytes:
+    """Compact UTF-8 JSON, through orjson when it is installed"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value)
+        except TypeError:
+            # Non-string keys, integers beyond 64 bits and other things only json accepts
+            pass
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+def dumps(value: Any) -> str:
+    """Compact JSON text, e.g. a result payload to store"""
+    return dumps_bytes(value).decode()
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Parse JSON text or bytes, through orjson when it is installed"""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            # NaN/Infinity literals written by the json fallback; real syntax errors raise below
+            pass
+    return json.loads(data)
+
+def join_array(items: Iterable[str]) -> str:
+    """A JSON array of already encoded JSON values, without parsing them"""
+    return "[" + ",".join(items) + "]"
+
+def raw_object(fields: Dict[str, str]) -> bytes:
+    """A JSON object body from already encoded member values"""
+    return ("{" + ",".join(f"{dumps(key)}:{value}" for key, value in fields.items()) + "}").encode()
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps_bytes; its encode time is recorded for the profiler"""
+
+    def render(self, content: Any) -> bytes:
+        with json_timer("encode"):
+            return dumps_bytes(content)
+
+class RawJSONResponse(Response):
+    """Response whose body is JSON that was encoded before the handler returned"""
+
+    media_type = "application/json"
@@ -1,13 +1,40 @@
 import os
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse, FileResponse
-from fastapi.staticfiles import StaticFiles
+import hashlib
+import secrets
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Query
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from typing import Optional, Dict, Any, List
-import uvicorn
-from sqlitedbadapter import SQLiteDBAdapter
+from sqlitedbadapter import SURVEY_FIELDS
+from storage import open_storage, batch_record_error
+from connectionpool import StorageTuning
+from surveycache import SurveyCache
+from sharedepochs import EpochTable
+from surveyschema import load_survey_json, question_names
+from resultvalidation import VALIDATION_MODES, ResultRejected, ValidatorCache
+from surveypatch import PatchError, VersionConflict
+from resultexport import EXPORT_MEDIA_TYPES, ndjson_stream, csv_stream
+from httpcache import BodyCache, cached_response
+from staticassets import StaticAssets
+from metrics import MetricsRegistry, MetricsMiddleware, instrument_storage, cache_gauges, pool_gauges
+from profiling import ProfileStore, ProfilingMiddleware, TracingConnection, json_timer
+from jsonutil import FastJSONResponse, RawJSONResponse
+import jsonutil
+from asyncdbadapter import AsyncSQLiteDBAdapter
 
-app = FastAPI(title="SurveyJS FastAPI Service", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The database is opened here rather than at import, so importing main stays cheap
+    open_database()
+    yield
+    # Drain the executor and close pooled connections on shutdown
+    close_database()
+    if profile_store is not None:
+        profile_store.close()
+
+app = FastAPI(title="SurveyJS FastAPI Service", version="1.0.0", lifespan=lifespan,
+              default_response_class=FastJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -18,65 +45,388 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="public/static"), name="static")
+# Static files and the SPA shell, served from memory
+static_assets = StaticAssets("public")
+
+# Storage engine, driven from a bounded thread pool so queries never block the event loop
+STORAGE_ENGINE = os.environ.get("SURVEYJS_STORAGE", "sqlite")
+DB_PATH = os.environ.get("SURVEYJS_DB_PATH", "surveyjs.db")
+# Memory engine calls are too short to be worth a thread hop
+DB_WORKERS = int(os.environ.get("SURVEYJS_DB_WORKERS", "0" if STORAGE_ENGINE == "memory" else "4"))
+DB_POOL_SIZE = int(os.environ.get("SURVEYJS_DB_POOL_SIZE", "5"))
+DB_GROUP_COMMIT = os.environ.get("SURVEYJS_GROUP_COMMIT", "1") == "1"
+DB_COUNTERS = os.environ.get("SURVEYJS_COUNTERS", "0") == "1"
+SURVEY_ID_STRATEGY = os.environ.get("SURVEYJS_ID_STRATEGY", "sequence")
+SURVEY_CACHE_SIZE = int(os.environ.get("SURVEYJS_SURVEY_CACHE_SIZE", "1024"))
+SURVEY_CACHE_TTL = float(os.environ.get("SURVEYJS_SURVEY_CACHE_TTL", "300"))
+# Memory-mapped change counters that carry survey cache invalidations to other worker processes
+CACHE_EPOCH_FILE = os.environ.get("SURVEYJS_CACHE_EPOCH_FILE", DB_PATH + "-epochs")
+# "binary" stores new results dictionary-coded (SQLite only); compression is a zlib level, 0 = off
+RESULT_FORMAT = os.environ.get("SURVEYJS_RESULT_FORMAT", "json")
+RESULT_COMPRESSION = int(os.environ.get("SURVEYJS_RESULT_COMPRESSION", "0"))
+MEMORY_SNAPSHOT_PATH = os.environ.get("SURVEYJS_MEMORY_SNAPSHOT") or None
+MEMORY_SNAPSHOT_INTERVAL = float(os.environ.get("SURVEYJS_MEMORY_SNAPSHOT_INTERVAL", "0"))
+# Opt-in profiling of requests selected by header, sampling or a latency threshold
+PROFILE_ENABLED = os.environ.get("SURVEYJS_PROFILE", "0") == "1"
+# Required by the profiling trigger header and, as a bearer token, by /debug/profiles
+PROFILE_TOKEN = os.environ.get("SURVEYJS_PROFILE_TOKEN") or None
+# Insert the demo surveys and results into an empty database on startup
+SEED_DEMO = os.environ.get("SURVEYJS_SEED_DEMO", "0") == "1"
+# Survey revisions are stored as patches, with the full definition after this many patches in a row
+REVISION_SNAPSHOT_INTERVAL = int(os.environ.get("SURVEYJS_REVISION_SNAPSHOT_INTERVAL", "20"))
+# Check posted answers against the survey definition: off, strip (drop what does not fit) or reject (400)
+RESULT_VALIDATION = os.environ.get("SURVEYJS_RESULT_VALIDATION", "off")
+if RESULT_VALIDATION not in VALIDATION_MODES:
+    raise ValueError(f"SURVEYJS_RESULT_VALIDATION must be one of {', '.join(VALIDATION_MODES)}")
+# Largest accepted result in bytes (0 = no limit); a survey's "maxResultBytes" property overrides it
+MAX_RESULT_BYTES = int(os.environ.get("SURVEYJS_MAX_RESULT_BYTES", str(1024 * 1024)))
+validators = ValidatorCache(MAX_RESULT_BYTES, SURVEY_CACHE_SIZE or 1024)
+survey_cache = None
+if STORAGE_ENGINE == "memory":
+    storage_options = dict(snapshot_path=MEMORY_SNAPSHOT_PATH, snapshot_interval=MEMORY_SNAPSHOT_INTERVAL)
+else:
+    survey_cache = SurveyCache(SURVEY_CACHE_SIZE, SURVEY_CACHE_TTL) if SURVEY_CACHE_SIZE > 0 else None
+    storage_options = dict(db_path=DB_PATH, pool_size=DB_POOL_SIZE, tuning=StorageTuning.from_env(),
+                           group_commit=DB_GROUP_COMMIT, counters=DB_COUNTERS, survey_cache=survey_cache,
+                           result_format=RESULT_FORMAT, result_compression=RESULT_COMPRESSION)
+    if PROFILE_ENABLED:
+        storage_options["connection_factory"] = TracingConnection
+# Set by open_database when the application starts
+db_adapter: Optional[AsyncSQLiteDBAdapter] = None
+
+# Encoded survey bodies, keyed by version so an edit never serves a stale body
+body_cache = BodyCache(int(os.environ.get("SURVEYJS_BODY_CACHE_SIZE", "256")))
+
+# Prometheus metrics at /metrics; SURVEYJS_METRICS=0 removes the middleware and storage wrappers
+METRICS_ENABLED = os.environ.get("SURVEYJS_METRICS", "1") == "1"
+metrics = MetricsRegistry() if METRICS_ENABLED else None
+if metrics is not None:
+    app.add_middleware(MetricsMiddleware, registry=metrics)
+    cache_gauges(metrics, {"survey": survey_cache, "body": body_cache})
+
+profile_store = None
+if PROFILE_ENABLED:
+    profile_threshold = os.environ.get("SURVEYJS_PROFILE_THRESHOLD_MS")
+    profile_store = ProfileStore(os.environ.get("SURVEYJS_PROFILE_DIR", "profiles"),
+                                 int(os.environ.get("SURVEYJS_PROFILE_KEEP", "100")))
+    app.add_middleware(ProfilingMiddleware, store=profile_store,
+                       threshold=float(profile_threshold) / 1000 if profile_threshold else None,
+                       sample_rate=float(os.environ.get("SURVEYJS_PROFILE_SAMPLE", "0")),
+                       token=PROFILE_TOKEN)
+
+def open_database() -> AsyncSQLiteDBAdapter:
+    """Open the configured storage engine once; called on startup"""
+    global db_adapter
+    if db_adapter is None:
+        if survey_cache is not None and CACHE_EPOCH_FILE:
+            # Mapped after any fork, so each worker has its own mapping of the shared file
+            survey_cache.clear()
+            survey_cache.epochs = EpochTable(CACHE_EPOCH_FILE)
+        storage = open_storage(STORAGE_ENGINE, id_strategy=SURVEY_ID_STRATEGY, seed_demo=SEED_DEMO,
+                               revision_snapshot_interval=REVISION_SNAPSHOT_INTERVAL, **storage_options)
+        if metrics is not None:
+            instrument_storage(storage, metrics)
+            if hasattr(storage, "pool"):
+                pool_gauges(metrics, storage.pool)
+        db_adapter = AsyncSQLiteDBAdapter(storage, max_workers=DB_WORKERS)
+    return db_adapter
 
-# SQLite database adapter
-db_adapter = SQLiteDBAdapter("surveyjs.db")
+def close_database():
+    global db_adapter
+    if db_adapter is not None:
+        db_adapter.close()
+        db_adapter = None
+    if survey_cache is not None and survey_cache.epochs is not None:
+        # Entries refer to slots of the closed mapping
+        survey_cache.clear()
+        survey_cache.epochs.close()
+        survey_cache.epochs = None
 
 API_BASE_ADDRESS = "/api"
+RESULTS_MAX_PAGE_SIZE = 10000
+SURVEYS_MAX_PAGE_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
 
 @app.get(f"{API_BASE_ADDRESS}/getActive")
-async def get_active():
-    return db_adapter.get_surveys()
+async def get_active(request: Request, fields: str = "id,name", limit: Optional[int] = None,
+                     after: Optional[str] = None, namePrefix: Optional[str] = None):
+    # The list view only needs id and name; pass fields=id,name,json for full definitions
+    field_list = [field.strip() for field in fields.split(",") if field.strip()]
+    if not field_list or any(field not in SURVEY_FIELDS for field in field_list):
+        raise HTTPException(status_code=400, detail=f"fields must be a subset of {','.join(SURVEY_FIELDS)}")
+    if limit is not None and (limit < 1 or limit > SURVEYS_MAX_PAGE_SIZE):
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {SURVEYS_MAX_PAGE_SIZE}")
+
+    # The catalog version changes with every survey insert, update and delete
+    query = hashlib.sha1(repr((field_list, limit, after, namePrefix)).encode()).hexdigest()[:16]
+    tag = f"active-{await db_adapter.get_catalog_version()}-{query}"
+    # Built even for a revalidation, whose 304 names the representation the body would be sent as
+    body = body_cache.get(tag)
+    if body is None:
+        # Keyset pagination needs the id even when it is not requested
+        columns = field_list if limit is None or "id" in field_list else ["id"] + field_list
+        surveys = await db_adapter.get_surveys(columns, limit, after, namePrefix)
+        if limit is None:
+            content = surveys
+        else:
+            next_cursor = surveys[-1]["id"] if len(surveys) == limit else None
+            content = {
+                "surveys": [{field: survey[field] for field in field_list} for survey in surveys],
+                "next": next_cursor
+            }
+        with json_timer("encode"):
+            encoded = jsonutil.dumps_bytes(content)
+        body = body_cache.put(tag, encoded)
+    return await cached_response(request, body, tag)
 
 @app.get(f"{API_BASE_ADDRESS}/getSurvey")
-async def get_survey(surveyId: str):
-    survey = db_adapter.get_survey(surveyId)
+async def get_survey(request: Request, surveyId: str):
+    survey = await db_adapter.get_survey_entry(surveyId)
     if not survey:
         raise HTTPException(status_code=404, detail="Survey not found")
-    return survey
+    tag = f"survey-{survey['id']}-{survey['version']}"
+    body = body_cache.get(tag)
+    if body is None:
+        content = {"id": survey["id"], "name": survey["name"], "json": survey["json"], "version": survey["version"]}
+        with json_timer("encode"):
+            encoded = jsonutil.dumps_bytes(content)
+        body = body_cache.put(tag, encoded)
+    return await cached_response(request, body, tag)
 
 @app.get(f"{API_BASE_ADDRESS}/changeName")
 async def change_name(id: str, name: str):
-    survey = db_adapter.change_name(id, name)
+    survey = await db_adapter.change_name(id, name)
     if not survey:
         raise HTTPException(status_code=404, detail="Survey not found")
     return survey
 
 @app.get(f"{API_BASE_ADDRESS}/create")
 async def create(name: Optional[str] = None):
-    return db_adapter.add_survey(name)
+    return await db_adapter.add_survey(name)
+
+async def read_json(request: Request) -> Any:
+    """Decode a JSON request body, timing it for the profiler"""
+    body = await request.body()
+    with json_timer("decode"):
+        return jsonutil.loads(body)
 
 @app.post(f"{API_BASE_ADDRESS}/changeJson")
 async def change_json(request: Request):
-    data = await request.json()
-    return db_adapter.store_survey(data.get("id"), None, data.get("json"))
+    data = await read_json(request)
+    base_version = data.get("baseVersion")
+    if base_version is not None and (not isinstance(base_version, int) or isinstance(base_version, bool)):
+        raise HTTPException(status_code=400, detail="baseVersion must be an integer")
+    try:
+        if "patch" not in data:
+            # The stored survey, as before versions existed, now with its version
+            return await db_adapter.store_survey(data.get("id"), None, data.get("json"), base_version)
+        if base_version is None:
+            raise HTTPException(status_code=400, detail="A patch needs the baseVersion it applies to")
+        survey = await db_adapter.patch_survey(data.get("id"), data["patch"], base_version)
+    except VersionConflict as conflict:
+        # The client reloads the survey (or the revisions since its version) and retries
+        raise HTTPException(status_code=409, detail={"message": "Survey was changed since baseVersion",
+                                                     "version": conflict.current})
+    except PatchError as error:
+        raise HTTPException(status_code=422, detail=str(error))
+    if survey is None:
+        raise HTTPException(status_code=404, detail="Survey not found")
+    # The client already holds the patched definition; only the new version goes back
+    return {"id": survey["id"], "name": survey["name"], "version": survey["version"]}
+
+@app.get(f"{API_BASE_ADDRESS}/getRevisions")
+async def get_revisions(surveyId: str):
+    return await db_adapter.get_revisions(surveyId)
+
+@app.get(f"{API_BASE_ADDRESS}/getRevision")
+async def get_revision(surveyId: str, version: Optional[int] = None):
+    revision = await db_adapter.get_revision(surveyId, version)
+    if revision is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return revision
+
+async def result_validator(post_id: Any):
+    """Compiled checks for a survey's results; without validation only the default size limit applies"""
+    if RESULT_VALIDATION == "off" or post_id is None:
+        return validators.default
+    return validators.get(str(post_id), await db_adapter.get_survey_entry(str(post_id)))
+
+def checked_result(validator, survey_result: Any, size: int) -> Any:
+    """The result to store, stripped of answers that do not fit; raises ResultRejected"""
+    validator.check_size(size)
+    if RESULT_VALIDATION == "off" or not isinstance(survey_result, dict):
+        return survey_result
+    return validator.validate(survey_result, RESULT_VALIDATION)
 
 @app.post(f"{API_BASE_ADDRESS}/post")
 async def post_results(request: Request):
-    data = await request.json()
-    return db_adapter.post_results(data.get("postId"), data.get("surveyResult"))
+    body = await request.body()
+    try:
+        if RESULT_VALIDATION == "off":
+            # No per-survey limit to look up, so an oversized body is refused before it is decoded
+            validators.default.check_size(len(body))
+        with json_timer("decode"):
+            data = jsonutil.loads(body)
+        # Same rule and message as /api/postBatch, before the storage layer would drop or fail the row
+        if data.get("postId") in (None, ""):
+            raise HTTPException(status_code=400, detail="Missing postId")
+        survey_result = checked_result(await result_validator(data.get("postId")), data.get("surveyResult"),
+                                       len(body))
+    except ResultRejected as error:
+        raise HTTPException(status_code=error.status, detail=str(error))
+    submission_id = data.get("submissionId")
+    # Stored as text, as in /api/postBatch
+    if isinstance(submission_id, (dict, list)):
+        raise HTTPException(status_code=400, detail="submissionId must be a string")
+    if submission_id is not None:
+        submission_id = str(submission_id)
+    return await db_adapter.post_results(str(data["postId"]), survey_result, submission_id)
+
+def parse_batch_body(body: bytes, content_type: str) -> List[Any]:
+    """Decode a JSON array or NDJSON upload; malformed NDJSON lines become None"""
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        records = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(jsonutil.loads(line))
+            except ValueError:
+                records.append(None)
+        return records
+    try:
+        records = jsonutil.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if not isinstance(records, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    return records
+
+@app.post(f"{API_BASE_ADDRESS}/postBatch")
+async def post_results_batch(request: Request):
+    body = await request.body()
+    with json_timer("decode"):
+        records = parse_batch_body(body, request.headers.get("content-type", ""))
+    rejected = {}
+    if validators.default.max_bytes or RESULT_VALIDATION != "off":
+        checked = []
+        for index, record in enumerate(records):
+            if batch_record_error(record) is None:
+                try:
+                    validator = await result_validator(record["postId"])
+                    size = len(jsonutil.dumps_bytes(record["surveyResult"])) if validator.max_bytes else 0
+                    record = dict(record, surveyResult=checked_result(validator, record["surveyResult"], size))
+                except ResultRejected as error:
+                    rejected[index] = str(error)
+                    continue
+            checked.append(record)
+        records = checked
+    statuses = await db_adapter.post_results_batch(records)
+    if rejected:
+        # Put the rejected records back at their positions in the upload
+        stored = iter(statuses)
+        statuses = []
+        for index in range(len(records) + len(rejected)):
+            if index in rejected:
+                statuses.append({"index": index, "status": "error", "error": rejected[index]})
+            else:
+                statuses.append(dict(next(stored), index=index))
+    return {
+        "results": statuses,
+        "created": sum(1 for status in statuses if status["status"] == "created"),
+        "duplicates": sum(1 for status in statuses if status["status"] == "duplicate"),
+        "errors": sum(1 for status in statuses if status["status"] == "error")
+    }
 
 @app.get(f"{API_BASE_ADDRESS}/delete")
 async def delete(id: str):
-    survey = db_adapter.delete_survey(id)
+    survey = await db_adapter.delete_survey(id)
     if not survey:
         raise HTTPException(status_code=404, detail="Survey not found")
     return {"id": id}
 
 @app.get(f"{API_BASE_ADDRESS}/results")
-async def get_results(postId: str):
-    results = db_adapter.get_results(postId)
+async def get_results(postId: str, limit: Optional[int] = None, after: Optional[int] = None):
+    if limit is not None:
+        # Cursor pagination: pass the returned "next" value as after to get the following page
+        if limit < 1 or limit > RESULTS_MAX_PAGE_SIZE:
+            raise HTTPException(status_code=400, detail=f"limit must be between 1 and {RESULTS_MAX_PAGE_SIZE}")
+        # Stored payloads are already JSON, so they are copied into the body without parsing
+        page = await db_adapter.get_results_page_json(postId, limit, after)
+        if page is None:
+            if after is None:
+                raise HTTPException(status_code=404, detail="Results not found")
+            return {"id": postId, "data": [], "next": None}
+        return RawJSONResponse(page)
+    results = await db_adapter.get_results_json(postId)
     if not results:
         raise HTTPException(status_code=404, detail="Results not found")
-    return results
+    return RawJSONResponse(results)
+
+@app.get(f"{API_BASE_ADDRESS}/statistics")
+async def get_statistics(postId: str):
+    statistics = await db_adapter.get_statistics(postId)
+    if not statistics:
+        raise HTTPException(status_code=404, detail="Survey not found")
+    return statistics
+
+@app.get(f"{API_BASE_ADDRESS}/exportResults")
+async def export_results(postId: str, export_format: str = Query("ndjson", alias="format")):
+    if export_format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    # Rows are read and sent one batch at a time, so memory does not grow with the result count
+    batches = db_adapter.iter_response_rows(postId, EXPORT_BATCH_SIZE)
+    if export_format == "csv":
+        survey = await db_adapter.get_survey(postId)
+        columns = question_names(load_survey_json(survey["json"])) if survey else []
+        body = csv_stream(columns, batches)
+    else:
+        body = ndjson_stream(batches)
+    return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES[export_format])
+
+@app.get("/metrics")
+async def get_metrics():
+    if metrics is None:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def check_profile_token(request: Request):
+    """Reports show query strings and timings, so they need the profiling token when one is set"""
+    if PROFILE_TOKEN is None:
+        return
+    authorization = request.headers.get("authorization", "")
+    if not secrets.compare_digest(authorization.encode(), f"Bearer {PROFILE_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Profiling token required",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+@app.get("/debug/profiles")
+async def list_profiles(request: Request):
+    check_profile_token(request)
+    if profile_store is None:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    return profile_store.summaries()
+
+@app.get("/debug/profiles/{report_id}")
+async def get_profile(request: Request, report_id: str):
+    check_profile_token(request)
+    report = profile_store.get(report_id) if profile_store is not None else None
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return report
+
+@app.get("/static/{path:path}")
+async def serve_asset(request: Request, path: str):
+    asset = await static_assets.get(path)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return await static_assets.respond(request, asset)
 
 # Serve the React app for all other routes
 @app.get("/{full_path:path}")
-async def serve_static(full_path: str):
+async def serve_static(request: Request, full_path: str):
     # Serve index.html for all routes to support React Router
-    return FileResponse("public/index.html")
+    return await static_assets.respond(request, static_assets.index)
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
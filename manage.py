@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from columnarexport import COLUMNAR_FORMATS, require_pyarrow, write_columnar
+from connectionpool import StorageTuning
+from httpcache import ENCODINGS, MIN_COMPRESS_SIZE, compress
+from resultcodec import RESULT_FORMATS
+from sqlitedbadapter import SQLiteDBAdapter
+from staticassets import PRECOMPRESSED_SUFFIXES, StaticAssets
+from surveyschema import load_survey_json
+
+def open_adapter(args) -> SQLiteDBAdapter:
+    return SQLiteDBAdapter(args.db, tuning=StorageTuning.from_env(),
+                           result_compression=int(os.environ.get("SURVEYJS_RESULT_COMPRESSION", "0")))
+
+def rebuild_counters(args) -> int:
+    adapter = open_adapter(args)
+    post_ids = adapter.rebuild_counters(args.post_id)
+    print(f"Rebuilt counters for {len(post_ids)} post id(s)")
+    adapter.close()
+    return 0
+
+def check_counters(args) -> int:
+    adapter = open_adapter(args)
+    problems = adapter.check_counters(args.post_id)
+    for problem in problems:
+        print(json.dumps(problem))
+    adapter.close()
+    if problems:
+        print(f"{len(problems)} inconsistent counter(s) found", file=sys.stderr)
+        return 1
+    print("Counters are consistent")
+    return 0
+
+def seed(args) -> int:
+    adapter = open_adapter(args)
+    seeded = adapter.populate_demo_data()
+    adapter.close()
+    print("Inserted the demo surveys and results" if seeded else "Database already has surveys; nothing inserted")
+    return 0
+
+def convert_results(args) -> int:
+    adapter = open_adapter(args)
+    converted = adapter.convert_results(args.to, args.post_id, args.batch_size)
+    print(f"Converted {converted} result(s) to {args.to}")
+    adapter.close()
+    if args.vacuum:
+        # Space freed by smaller payloads is only returned to the filesystem by VACUUM
+        conn = sqlite3.connect(args.db, isolation_level=None)
+        conn.execute('VACUUM')
+        conn.close()
+    return 0
+
+def export_columnar(args) -> int:
+    try:
+        require_pyarrow()
+    except RuntimeError as error:
+        print(error, file=sys.stderr)
+        return 1
+    adapter = open_adapter(args)
+    survey = adapter.get_survey(args.post_id)
+    if survey is None:
+        print(f"No survey with id {args.post_id}; only seq and created_at are exported", file=sys.stderr)
+    output = args.output or f"results-{args.post_id}.{args.format}"
+    count = write_columnar(output, args.format, load_survey_json(survey["json"] if survey else None),
+                           adapter.iter_response_rows(args.post_id, args.batch_size))
+    print(f"Wrote {count} result(s) to {output}")
+    adapter.close()
+    return 0
+
+def precompress_static(args) -> int:
+    written = 0
+    for path in StaticAssets.manifest_paths(args.public):
+        source = os.path.join(args.public, "static", path)
+        if not os.path.isfile(source):
+            print(f"Skipping missing asset {path}", file=sys.stderr)
+            continue
+        with open(source, "rb") as f:
+            content = f.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            continue
+        for encoding in ENCODINGS:
+            with open(source + PRECOMPRESSED_SUFFIXES[encoding], "wb") as f:
+                f.write(compress(content, encoding))
+            written += 1
+    print(f"Wrote {written} precompressed file(s) ({', '.join(ENCODINGS)})")
+    return 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="SurveyJS service maintenance commands")
+    parser.add_argument("--db", default=os.environ.get("SURVEYJS_DB_PATH", "surveyjs.db"),
+                        help="SQLite database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("rebuild-counters", help="Recompute materialized answer counters from stored results")
+    command.add_argument("--post-id", help="Only rebuild this post id")
+    command.set_defaults(handler=rebuild_counters)
+
+    command = commands.add_parser("check-counters", help="Compare materialized answer counters with a full scan")
+    command.add_argument("--post-id", help="Only check this post id")
+    command.set_defaults(handler=check_counters)
+
+    command = commands.add_parser("seed", help="Insert the demo surveys and results into an empty database")
+    command.set_defaults(handler=seed)
+
+    command = commands.add_parser("convert-results", help="Rewrite stored results as JSON text or binary payloads")
+    command.add_argument("--to", choices=RESULT_FORMATS, required=True, help="Target payload format")
+    command.add_argument("--post-id", help="Only convert this post id")
+    command.add_argument("--batch-size", type=int, default=1000, help="Rows converted per transaction")
+    command.add_argument("--vacuum", action="store_true", help="VACUUM the database afterwards")
+    command.set_defaults(handler=convert_results)
+
+    command = commands.add_parser("export-columnar", help="Write a post's results as a Parquet or Arrow IPC file")
+    command.add_argument("--post-id", required=True, help="Post id to export")
+    command.add_argument("--format", choices=COLUMNAR_FORMATS, default="parquet", help="Output file format")
+    command.add_argument("--output", help="Output file (default results-ID.FORMAT)")
+    command.add_argument("--batch-size", type=int, default=10000, help="Results per row group / record batch")
+    command.set_defaults(handler=export_columnar)
+
+    command = commands.add_parser("precompress-static", help="Write .gz/.br copies of the hashed build assets")
+    command.add_argument("--public", default="public", help="Frontend build directory")
+    command.set_defaults(handler=precompress_static)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,378 @@
+import json
+import os
+import time
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Iterator
+from aggregation import describe_questions, answer_histograms, summarize
+from sqlitedbadapter import SURVEY_FIELDS
+from storage import demo_rows, load_demo_data, post_batch, results_json, results_page, results_page_json, iter_rows
+from profiling import json_timer
+import jsonutil
+from surveyids import ID_STRATEGIES, new_ulid
+from surveyschema import load_survey_json
+from surveypatch import VersionConflict, apply_patch, revision_data, replay
+
+class MemoryStorage:
+    """Dict-backed storage engine with optional JSON snapshots on disk
+
+    All data lives in process memory behind one lock. With snapshot_path set,
+    the state is loaded from that file on start and written back on close()
+    and, if snapshot_interval is positive, every snapshot_interval seconds;
+    anything posted after the last snapshot is lost if the process dies.
+    """
+
+    # Posts are stored synchronously; there is no group-commit writer
+    writer = None
+
+    def __init__(self, snapshot_path: Optional[str] = None, snapshot_interval: float = 0,
+                 id_strategy: str = "sequence", seed_demo: bool = False, revision_snapshot_interval: int = 20):
+        if id_strategy not in ID_STRATEGIES:
+            raise ValueError(f"Unknown survey id strategy: {id_strategy}")
+        self.snapshot_path = snapshot_path
+        self.id_strategy = id_strategy
+        self._lock = threading.RLock()
+        # survey id -> {"id", "name", "json", "version"}, in insertion order
+        self._surveys = {}
+        # survey id -> [(version, created_at, depth, data)], oldest first; see SQLiteDBAdapter.record_revision
+        self._revisions = {}
+        self.revision_snapshot_interval = max(1, revision_snapshot_interval)
+        # post id -> [(seq, created_at, payload, submission_id)]
+        self._responses = {}
+        # post id -> submission ids already stored
+        self._submissions = {}
+        self._seq = 0
+        self._survey_id_seq = 0
+        # Versions come from one counter, so a survey recreated under a deleted id never repeats an ETag;
+        # without a snapshot both counters start from the clock, so they do not repeat across restarts either
+        self._catalog_version = self._version_seq = int(time.time() * 1000)
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load_snapshot()
+        elif seed_demo:
+            self.populate_demo_data()
+        self._stop = threading.Event()
+        self._snapshotter = None
+        if snapshot_path and snapshot_interval > 0:
+            self._snapshotter = threading.Thread(target=self._snapshot_loop, args=(snapshot_interval,),
+                                                 name="surveyjs-snapshot", daemon=True)
+            self._snapshotter.start()
+
+    @contextmanager
+    def transaction(self):
+        """Hold the storage lock across several calls
+
+        Calls inside the block are isolated from other threads but are not
+        rolled back if the block raises.
+        """
+        with self._lock:
+            yield self
+
+    def close(self):
+        """Stop periodic snapshots and write a final one"""
+        self._stop.set()
+        if self._snapshotter is not None:
+            self._snapshotter.join()
+        if self.snapshot_path:
+            self.snapshot()
+
+    def _snapshot_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            self.snapshot()
+
+    def snapshot(self):
+        """Write the whole state to snapshot_path, replacing the previous snapshot atomically"""
+        # Survey entries are replaced rather than changed and rows are tuples, so copying the
+        # containers under the lock is enough; storage calls wait only for that, not for json.dumps
+        with self._lock:
+            state = {
+                "seq": self._seq,
+                "survey_id_seq": self._survey_id_seq,
+                "catalog_version": self._catalog_version,
+                "version_seq": self._version_seq,
+                "surveys": list(self._surveys.values()),
+                "revisions": {survey_id: list(rows) for survey_id, rows in self._revisions.items()},
+                "responses": {post_id: list(rows) for post_id, rows in self._responses.items()}
+            }
+        data = json.dumps(state, separators=(",", ":"))
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+
+    def load_snapshot(self):
+        """Replace the state with the contents of snapshot_path"""
+        with open(self.snapshot_path) as f:
+            state = json.load(f)
+        with self._lock:
+            self._seq = state["seq"]
+            self._survey_id_seq = state["survey_id_seq"]
+            self._catalog_version = state["catalog_version"]
+            self._surveys = {survey["id"]: survey for survey in state["surveys"]}
+            # Older snapshots have no version counter; the catalog version is at least every version handed out
+            self._version_seq = state.get("version_seq", max([self._catalog_version] +
+                                                             [survey["version"] for survey in state["surveys"]]))
+            # Snapshots written before revisions existed have none
+            self._revisions = {survey_id: [tuple(row) for row in rows]
+                               for survey_id, rows in state.get("revisions", {}).items()}
+            self._responses = {post_id: [tuple(row) for row in rows]
+                               for post_id, rows in state["responses"].items()}
+            self._submissions = {post_id: {row[3] for row in rows if row[3] is not None}
+                                 for post_id, rows in self._responses.items()}
+
+    def populate_demo_data(self) -> bool:
+        """Populate the storage with demo data if it's empty; returns whether it was seeded"""
+        with self._lock:
+            if self._surveys:
+                return False
+            surveys, results = demo_rows()
+            for survey_id, name, json_data in surveys:
+                self.store_survey(survey_id, name, json_data)
+            now = time.time()
+            self.insert_responses([(post_id, now, payload, None) for post_id, payload in results])
+            return True
+
+    def next_version(self) -> int:
+        self._version_seq += 1
+        return self._version_seq
+
+    def survey_changed(self, survey_id: str):
+        self._catalog_version += 1
+        # Keep the sequence ahead of numeric ids created through store_survey (the surveys_id_seq
+        # trigger of the SQLite engine); other ids, including a missing one, leave it alone
+        if (isinstance(survey_id, str) and survey_id.isdigit() and not survey_id.startswith("0")
+                and len(survey_id) <= 15):
+            self._survey_id_seq = max(self._survey_id_seq, int(survey_id))
+
+    def get_surveys(self, fields: Optional[List[str]] = None, limit: Optional[int] = None,
+                    after: Optional[str] = None, name_prefix: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get surveys; same filtering and paging rules as SQLiteDBAdapter.get_surveys"""
+        fields = fields or list(SURVEY_FIELDS)
+        for field in fields:
+            if field not in SURVEY_FIELDS:
+                raise ValueError(f"Unknown survey field: {field}")
+
+        with self._lock:
+            surveys = list(self._surveys.values())
+        if name_prefix:
+            surveys = [survey for survey in surveys if survey["name"].startswith(name_prefix)]
+        if after is not None:
+            surveys = [survey for survey in surveys if survey["id"] > after]
+        if limit is not None:
+            surveys = sorted(surveys, key=lambda survey: survey["id"])[:limit]
+        return [{field: survey[field] for field in fields} for survey in surveys]
+
+    def get_survey(self, survey_id: str) -> Optional[Dict[str, Any]]:
+        """Get a specific survey by ID"""
+        survey = self._surveys.get(survey_id)
+        if survey is None:
+            return None
+        return {"id": survey["id"], "name": survey["name"], "json": survey["json"]}
+
+    def get_survey_entry(self, survey_id: str) -> Optional[Dict[str, Any]]:
+        """Get a survey together with its version number"""
+        survey = self._surveys.get(survey_id)
+        return dict(survey) if survey is not None else None
+
+    def get_catalog_version(self) -> int:
+        """Version of the survey list; changes whenever any survey is added, edited or deleted"""
+        return self._catalog_version
+
+    def add_survey(self, name: Optional[str] = None) -> Dict[str, Any]:
+        """Add a new survey"""
+        with self._lock:
+            while True:
+                if self.id_strategy == "ulid":
+                    new_id = new_ulid()
+                else:
+                    self._survey_id_seq += 1
+                    new_id = str(self._survey_id_seq)
+                if new_id not in self._surveys:
+                    break
+            new_name = name or f"{load_demo_data()['default_name']} {new_id}"
+            self._surveys[new_id] = {"id": new_id, "name": new_name, "json": "{}", "version": self.next_version()}
+            self.survey_changed(new_id)
+            return {"id": new_id, "name": new_name, "json": "{}"}
+
+    def change_name(self, survey_id: str, name: str) -> Optional[Dict[str, Any]]:
+        """Change the name of a survey"""
+        with self._lock:
+            survey = self._surveys.get(survey_id)
+            if survey is None:
+                return None
+            self._surveys[survey_id] = dict(survey, name=name, version=self.next_version())
+            self.survey_changed(survey_id)
+            return self.get_survey(survey_id)
+
+    def check_version(self, survey_id: str, base_version: Optional[int]) -> Optional[Dict[str, Any]]:
+        """The survey, after checking it is still at base_version (if given); None if it does not exist"""
+        survey = self._surveys.get(survey_id)
+        if base_version is not None and survey is not None and survey["version"] != base_version:
+            raise VersionConflict(survey["version"])
+        return survey
+
+    def record_revision(self, survey_id: str, version: int, previous_json: Optional[str],
+                        json_data: Optional[str], delta: Optional[str] = None):
+        """Append a survey definition change to its revision history"""
+        revisions = self._revisions.setdefault(survey_id, [])
+        depth, data = revision_data((revisions[-1][2], previous_json) if revisions else None, json_data, delta,
+                                    self.revision_snapshot_interval)
+        revisions.append((version, time.time(), depth, data))
+
+    def store_survey(self, survey_id: str, name: Optional[str], json_data: Optional[str],
+                     base_version: Optional[int] = None) -> Dict[str, Any]:
+        """Store or update a survey; with base_version, only if it is still at that version"""
+        with self._lock:
+            survey = self.check_version(survey_id, base_version)
+            if survey is not None:
+                self._surveys[survey_id] = dict(survey, json=json_data, version=self.next_version())
+            elif base_version is not None:
+                # The edit was based on a survey that has since been deleted
+                raise VersionConflict(None)
+            else:
+                self._surveys[survey_id] = {"id": survey_id, "name": name or str(survey_id),
+                                            "json": json_data, "version": self.next_version()}
+            self.record_revision(survey_id, self._surveys[survey_id]["version"],
+                                 survey["json"] if survey is not None else None, json_data)
+            self.survey_changed(survey_id)
+            return self.get_survey_entry(survey_id)
+
+    def patch_survey(self, survey_id: str, operations: List[Any], base_version: int) -> Optional[Dict[str, Any]]:
+        """Apply a JSON Patch to a survey that is still at base_version; None if it does not exist"""
+        with self._lock:
+            survey = self.check_version(survey_id, base_version)
+            if survey is None:
+                return None
+            # Serialized first: applying the patch may change its values in place
+            delta = jsonutil.dumps(operations)
+            json_data = jsonutil.dumps(apply_patch(load_survey_json(survey["json"]), operations))
+            self._surveys[survey_id] = dict(survey, json=json_data, version=self.next_version())
+            self.record_revision(survey_id, self._surveys[survey_id]["version"], survey["json"], json_data, delta)
+            self.survey_changed(survey_id)
+            return self.get_survey_entry(survey_id)
+
+    def get_revisions(self, survey_id: str) -> List[Dict[str, Any]]:
+        """Versions in a survey's definition history, newest first"""
+        with self._lock:
+            return [{"version": version, "createdAt": created_at, "snapshot": depth == 0, "bytes": len(data)}
+                    for version, created_at, depth, data in reversed(self._revisions.get(survey_id, []))]
+
+    def get_revision(self, survey_id: str, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """A survey's definition as of a version (default: the latest), rebuilt from the nearest snapshot"""
+        with self._lock:
+            revisions = [row for row in self._revisions.get(survey_id, []) if version is None or row[0] <= version]
+            if not revisions:
+                return None
+            latest = revisions[-1]
+            chain = [row[3] for row in revisions[len(revisions) - 1 - latest[2]:]]
+        return {"id": survey_id, "version": latest[0], "json": jsonutil.dumps(replay(chain))}
+
+    def delete_survey(self, survey_id: str) -> Optional[Dict[str, Any]]:
+        """Delete a survey"""
+        with self._lock:
+            survey = self.get_survey(survey_id)
+            if survey:
+                del self._surveys[survey_id]
+                self._revisions.pop(survey_id, None)
+                self.survey_changed(survey_id)
+            return survey
+
+    def insert_responses(self, rows: List[tuple]) -> List[bool]:
+        """Store (post_id, created_at, payload, submission_id) rows; False for duplicate submission ids"""
+        inserted = []
+        with self._lock:
+            for post_id, created_at, payload, submission_id in rows:
+                if submission_id is not None:
+                    submissions = self._submissions.setdefault(post_id, set())
+                    if submission_id in submissions:
+                        inserted.append(False)
+                        continue
+                    submissions.add(submission_id)
+                self._seq += 1
+                self._responses.setdefault(post_id, []).append((self._seq, created_at, payload, submission_id))
+                inserted.append(True)
+        return inserted
+
+    def submit_results(self, post_id: str, survey_result: Dict[str, Any],
+                       submission_id: Optional[str] = None) -> Future:
+        """Store survey results at once; the returned Future is already resolved"""
+        future = Future()
+        try:
+            with json_timer("encode"):
+                payload = jsonutil.dumps(survey_result)
+            future.set_result(self.insert_responses([(post_id, time.time(), payload, submission_id)]))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+    def post_results(self, post_id: str, survey_result: Dict[str, Any],
+                     submission_id: Optional[str] = None) -> Dict[str, Any]:
+        """Post survey results"""
+        with json_timer("encode"):
+            payload = jsonutil.dumps(survey_result)
+        self.insert_responses([(post_id, time.time(), payload, submission_id)])
+        return {}
+
+    def post_results_batch(self, records: List[Any]) -> List[Dict[str, Any]]:
+        """Post many {postId, surveyResult, submissionId} records at once"""
+        return post_batch(records, self.insert_responses)
+
+    def get_results(self, post_id: str) -> Optional[Dict[str, Any]]:
+        """Get survey results by post ID"""
+        with self._lock:
+            rows = list(self._responses.get(post_id, ()))
+        if rows:
+            with json_timer("decode"):
+                data = [jsonutil.loads(row[2]) for row in rows]
+            return {
+                "id": post_id,
+                "data": data
+            }
+        return None
+
+    def get_results_json(self, post_id: str) -> Optional[bytes]:
+        """get_results as a JSON body, with the stored payloads spliced in unparsed"""
+        return results_json(post_id, self.get_response_rows(post_id, None, None))
+
+    def get_response_rows(self, post_id: str, after: Optional[int] = None, limit: Optional[int] = 1000) -> List[tuple]:
+        """(seq, created_at, payload) rows after the after cursor, up to limit (None: all)"""
+        with self._lock:
+            rows = self._responses.get(post_id, ())
+            # Rows are appended in seq order, so the cursor position can be bisected
+            low, high = 0, len(rows)
+            while low < high:
+                middle = (low + high) // 2
+                if rows[middle][0] <= (after or 0):
+                    low = middle + 1
+                else:
+                    high = middle
+            return [row[:3] for row in rows[low:None if limit is None else low + limit]]
+
+    def get_results_page(self, post_id: str, limit: int, after: Optional[int] = None) -> Dict[str, Any]:
+        """Get one page of survey results; next is the cursor of the following page"""
+        return results_page(post_id, self.get_response_rows(post_id, after, limit), limit)
+
+    def get_results_page_json(self, post_id: str, limit: int, after: Optional[int] = None) -> Optional[bytes]:
+        """get_results_page as a JSON body, with the stored payloads spliced in unparsed; None if the page is empty"""
+        return results_page_json(post_id, self.get_response_rows(post_id, after, limit), limit)
+
+    def iter_response_rows(self, post_id: str, batch_size: int = 1000) -> Iterator[List[tuple]]:
+        """Yield batches of response rows"""
+        return iter_rows(self.get_response_rows, post_id, batch_size)
+
+    def get_statistics(self, post_id: str) -> Optional[Dict[str, Any]]:
+        """Per-question answer statistics, computed from the survey's question types"""
+        survey = self.get_survey(post_id)
+        if not survey:
+            return None
+        questions = describe_questions(load_survey_json(survey["json"]))
+        with self._lock:
+            rows = list(self._responses.get(post_id, ()))
+        results = [jsonutil.loads(row[2]) for row in rows]
+        return {
+            "id": post_id,
+            "responses": len(results),
+            "questions": summarize(questions, answer_histograms(questions, results))
+        }
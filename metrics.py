@@ -0,0 +1,272 @@
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from typing import Dict, Any, Optional, Callable, Iterable, Tuple
+
+# Upper bounds (seconds) of latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Storage engine methods timed by instrument_storage
+STORAGE_METHODS = (
+    "get_surveys", "get_survey", "get_survey_entry", "get_catalog_version", "add_survey", "change_name",
+    "store_survey", "patch_survey", "get_revisions", "get_revision", "delete_survey", "submit_results",
+    "post_results", "post_results_batch", "get_results", "get_results_json", "get_response_rows",
+    "get_results_page", "get_results_page_json", "get_statistics"
+)
+
+def escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter with one value per label combination"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{format_labels(self.labels, labels)} {format_value(value)}"
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label combination"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = format_labels(self.labels, labels, f'le="{format_value(bound)}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.labels, labels)} {format_value(total)}"
+            yield f"{self.name}_count{format_labels(self.labels, labels)} {cumulative}"
+
+class Gauge:
+    """Value read from a callback at scrape time; collect returns (label values, value) pairs"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], collect: Callable[[], Iterable[tuple]]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.collect = collect
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self.collect():
+            if value is not None:
+                yield f"{self.name}{format_labels(self.labels, labels)} {format_value(value)}"
+
+class CollectedCounter(Gauge):
+    """Monotonic total kept elsewhere (e.g. cache stats) and read from a callback at scrape time"""
+
+    kind = "counter"
+
+class MetricsRegistry:
+    """Metrics rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        # Re-registering a name (e.g. storage reopened by a second app startup) replaces the old metric
+        self._metrics = [existing for existing in self._metrics if existing.name != metric.name]
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, labels: Tuple[str, ...], collect: Callable[[], Iterable[tuple]]) -> Gauge:
+        return self.register(Gauge(name, help, labels, collect))
+
+    def collected_counter(self, name: str, help: str, labels: Tuple[str, ...],
+                          collect: Callable[[], Iterable[tuple]]) -> CollectedCounter:
+        return self.register(CollectedCounter(name, help, labels, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests, response bytes and latency per route template"""
+
+    def __init__(self, app, registry: MetricsRegistry):
+        self.app = app
+        self.requests = registry.counter(
+            "surveyjs_http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+        self.latency = registry.histogram(
+            "surveyjs_http_request_seconds", "Time until the response body was fully sent", ("method", "route"))
+        self.response_bytes = registry.counter(
+            "surveyjs_http_response_bytes_total", "Response body bytes sent (after compression)", ("method", "route"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+        sent = 0
+
+        async def send_wrapper(message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # FastAPI stores the matched route in the scope; templates keep label cardinality bounded
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            self.requests.inc(method, route, status)
+            self.latency.observe(time.perf_counter() - started, method, route)
+            self.response_bytes.inc(method, route, amount=sent)
+
+# [rows, payload bytes] read by storage calls nested in the instrumented call running in this context
+storage_reads = contextvars.ContextVar("surveyjs_storage_reads", default=None)
+
+def result_row_count(method: str, result: Any) -> Optional[int]:
+    """Number of result rows a storage call returned"""
+    if method == "get_response_rows":
+        return len(result)
+    if method in ("get_results", "get_results_page") and result:
+        return len(result["data"])
+    return None
+
+def instrument_storage(storage: Any, registry: MetricsRegistry):
+    """Time every storage engine operation and count the result rows it reads"""
+    timings = registry.histogram(
+        "surveyjs_storage_seconds", "Storage engine call duration", ("method",))
+    rows = registry.counter(
+        "surveyjs_result_rows_read_total", "Result rows returned by storage calls", ("method",))
+    payload_bytes = registry.counter(
+        "surveyjs_result_payload_bytes_read_total", "Stored result payload bytes read for exports and raw JSON bodies",
+        ("method",))
+
+    def timed(method: str, func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            outer = storage_reads.get()
+            if outer is not None:
+                # Called by another storage method (get_results_json reading get_response_rows):
+                # only the outer call is timed, and what this one read is reported as its reads
+                result = func(*args, **kwargs)
+                count = result_row_count(method, result)
+                if count:
+                    outer[0] += count
+                    if method == "get_response_rows":
+                        outer[1] += sum(len(row[2]) for row in result)
+                return result
+            reads = [0, 0]
+            token = storage_reads.set(reads)
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                timings.observe(time.perf_counter() - started, method)
+                storage_reads.reset(token)
+            count = result_row_count(method, result)
+            if count is None:
+                count = reads[0]
+            if count:
+                rows.inc(method, amount=count)
+            if method.endswith("_json"):
+                # The body holds the payloads, so the rows fetched for it are not counted again
+                read_bytes = len(result) if result else 0
+            elif method == "get_response_rows":
+                read_bytes = sum(len(row[2]) for row in result)
+            else:
+                read_bytes = reads[1]
+            if read_bytes:
+                payload_bytes.inc(method, amount=read_bytes)
+            return result
+        return wrapper
+
+    # Instance attributes shadow the methods, so every caller goes through the wrappers
+    for method in STORAGE_METHODS:
+        func = getattr(storage, method, None)
+        if func is not None:
+            setattr(storage, method, timed(method, func))
+
+def cache_gauges(registry: MetricsRegistry, caches: Dict[str, Any]):
+    """Expose stats() of named caches (SurveyCache, BodyCache); hits and misses are counters"""
+    def collect(key: str):
+        def values():
+            for name, cache in caches.items():
+                if cache is not None:
+                    yield (name,), cache.stats()[key]
+        return values
+
+    registry.collected_counter("surveyjs_cache_hits_total", "Cache hits since start", ("cache",), collect("hits"))
+    registry.collected_counter("surveyjs_cache_misses_total", "Cache misses since start", ("cache",), collect("misses"))
+    registry.gauge("surveyjs_cache_hit_ratio", "Cache hits / lookups since start", ("cache",), collect("hit_ratio"))
+    registry.gauge("surveyjs_cache_entries", "Entries currently cached", ("cache",), collect("size"))
+
+def pool_gauges(registry: MetricsRegistry, pool: Any):
+    """Expose connection pool occupancy; in_use close to size means callers wait for connections"""
+    def connections():
+        stats = pool.stats()
+        for state in ("open", "idle", "in_use"):
+            yield (state,), stats[state]
+
+    registry.gauge("surveyjs_pool_connections", "Pooled SQLite connections by state", ("state",), connections)
+    registry.gauge("surveyjs_pool_size", "Maximum pooled SQLite connections", (), lambda: [((), pool.size)])
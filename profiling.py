@@ -0,0 +1,302 @@
+import cProfile
+import contextvars
+import io
+import json
+import os
+import pstats
+import random
+import sqlite3
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Callable
+
+# Statements kept per trace; later ones are only counted
+MAX_STATEMENTS = 500
+
+# Lines of cProfile output kept per report
+PROFILE_LINES = 60
+
+class RequestTrace:
+    """SQL statements, JSON time and storage spans recorded while one request runs"""
+
+    def __init__(self, profiling: bool):
+        self.profiling = profiling
+        self.thread_id = threading.get_ident()
+        self.statements = []
+        self.dropped_statements = 0
+        self.json = {"encode": [0, 0.0], "decode": [0, 0.0]}
+        self.spans = []
+        self.profiles = []
+        self._lock = threading.Lock()
+
+    def add_statement(self, sql: str, seconds: float, rows: int):
+        with self._lock:
+            if len(self.statements) < MAX_STATEMENTS:
+                self.statements.append((" ".join(sql.split()), seconds, rows))
+            else:
+                self.dropped_statements += 1
+
+    def add_json(self, kind: str, seconds: float):
+        with self._lock:
+            self.json[kind][0] += 1
+            self.json[kind][1] += seconds
+
+    def add_span(self, name: str, seconds: float, waited: Optional[float] = None):
+        with self._lock:
+            self.spans.append({"name": name, "ms": seconds * 1000,
+                               "queued_ms": None if waited is None else waited * 1000})
+
+    def add_profile(self, profile: cProfile.Profile):
+        with self._lock:
+            self.profiles.append(profile)
+
+    def report(self) -> Dict[str, Any]:
+        statements = [{"sql": sql, "ms": seconds * 1000, "rows": rows} for sql, seconds, rows in self.statements]
+        report = {
+            "sql": {
+                "count": len(statements) + self.dropped_statements,
+                "ms": sum(statement["ms"] for statement in statements),
+                "statements": statements
+            },
+            "json": {kind: {"calls": calls, "ms": seconds * 1000} for kind, (calls, seconds) in self.json.items()},
+            "spans": self.spans
+        }
+        if self.profiles:
+            # Profiles of the event loop thread and of every executor call are merged
+            output = io.StringIO()
+            stats = pstats.Stats(self.profiles[0], stream=output)
+            for profile in self.profiles[1:]:
+                stats.add(profile)
+            stats.sort_stats("cumulative").print_stats(PROFILE_LINES)
+            report["profile"] = output.getvalue().splitlines()
+        return report
+
+class TraceGroup:
+    """Records into several traces at once, for work shared by their requests (a group commit)"""
+
+    def __init__(self, traces: List[RequestTrace]):
+        self.traces = traces
+        self.profiling = False
+        self.thread_id = None
+
+    def add_statement(self, sql: str, seconds: float, rows: int):
+        for trace in self.traces:
+            trace.add_statement(sql, seconds, rows)
+
+    def add_json(self, kind: str, seconds: float):
+        for trace in self.traces:
+            trace.add_json(kind, seconds)
+
+    def add_span(self, name: str, seconds: float, waited: Optional[float] = None):
+        for trace in self.traces:
+            trace.add_span(name, seconds, waited)
+
+# Trace of the request being handled; copied into executor threads with the context
+current_trace = contextvars.ContextVar("surveyjs_trace", default=None)
+
+class json_timer:
+    """Time a JSON encode or decode block into the current trace, if there is one"""
+
+    __slots__ = ("kind", "trace", "started")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+
+    def __enter__(self):
+        self.trace = current_trace.get()
+        if self.trace is not None:
+            self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.trace is not None:
+            self.trace.add_json(self.kind, time.perf_counter() - self.started)
+
+class TracingCursor(sqlite3.Cursor):
+    """Cursor that records statement timings while a trace is active"""
+
+    def execute(self, sql, parameters=()):
+        trace = current_trace.get()
+        if trace is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            trace.add_statement(sql, time.perf_counter() - started, self.rowcount)
+
+    def executemany(self, sql, seq_of_parameters):
+        trace = current_trace.get()
+        if trace is None:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            trace.add_statement(sql, time.perf_counter() - started, self.rowcount)
+
+class TracingConnection(sqlite3.Connection):
+    """Connection factory whose cursors (including conn.execute's) are TracingCursors"""
+
+    def cursor(self, factory=TracingCursor):
+        return super().cursor(factory)
+
+def run_traced(func: Callable, queued_at: Optional[float], *args, **kwargs):
+    """Run a storage call, recording it as a span (and profiling it) when a trace is active"""
+    trace = current_trace.get()
+    if trace is None:
+        return func(*args, **kwargs)
+    started = time.perf_counter()
+    # cProfile hooks one thread; the event loop thread already has the request's profiler
+    profile = None
+    if trace.profiling and threading.get_ident() != trace.thread_id:
+        profile = cProfile.Profile()
+        profile.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        if profile is not None:
+            profile.disable()
+            trace.add_profile(profile)
+        trace.add_span(f"storage.{getattr(func, '__name__', 'call')}", time.perf_counter() - started,
+                       None if queued_at is None else started - queued_at)
+
+class ProfileStore:
+    """Most recent reports in memory, also written as JSON files to a rotating directory"""
+
+    def __init__(self, directory: Optional[str], keep: int = 100):
+        self.directory = directory
+        self.keep = keep
+        self._reports = OrderedDict()
+        self._lock = threading.Lock()
+        # One thread, so files are written and rotated in report order off the event loop
+        self._writer = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profile-writer")
+
+    def add(self, report: Dict[str, Any]):
+        with self._lock:
+            self._reports[report["id"]] = report
+            while len(self._reports) > self.keep:
+                self._reports.popitem(last=False)
+        if self._writer is not None:
+            self._writer.submit(self.write, report)
+
+    def close(self):
+        """Wait for queued reports to be written"""
+        if self._writer is not None:
+            self._writer.shutdown(wait=True)
+
+    def write(self, report: Dict[str, Any]):
+        try:
+            self.write_file(report)
+        except OSError:
+            # A full or missing directory must not stop later reports
+            traceback.print_exc()
+
+    def write_file(self, report: Dict[str, Any]):
+        with open(os.path.join(self.directory, f"{report['id']}.json"), "w") as f:
+            json.dump(report, f, indent=1)
+        # Report ids start with a timestamp, so name order is age order
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(".json"))
+        for name in names[:-self.keep]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def get(self, report_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._reports.get(report_id)
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            reports = list(self._reports.values())
+        return [{key: report[key] for key in ("id", "method", "path", "status", "ms", "trigger")}
+                for report in reversed(reports)]
+
+class ProfilingMiddleware:
+    """ASGI middleware that traces and profiles selected requests
+
+    A request is fully profiled (cProfile plus SQL/JSON/storage timings) when
+    it carries the trigger header (whose value must equal token, if one is
+    set) or is picked by sample_rate. With threshold set, every other request
+    is traced without cProfile and the trace is kept only if the request took
+    at least threshold seconds. Requests that match neither cost nothing.
+    """
+
+    def __init__(self, app, store: ProfileStore, header: str = "x-surveyjs-profile",
+                 threshold: Optional[float] = None, sample_rate: float = 0.0, token: Optional[str] = None):
+        self.app = app
+        self.store = store
+        self.header = header.lower().encode()
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.token = token
+        # Only one cProfile can run on the event loop thread at a time
+        self._profiling = False
+
+    def triggered(self, scope) -> Optional[str]:
+        for name, value in scope["headers"]:
+            if name == self.header and (self.token is None or value.decode("latin-1") == self.token):
+                return "header"
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trigger = self.triggered(scope)
+        if trigger is None and self.threshold is None:
+            await self.app(scope, receive, send)
+            return
+
+        full = trigger is not None and not self._profiling
+        trace = RequestTrace(profiling=full)
+        token = current_trace.set(trace)
+        report_id = f"{time.time():.6f}-{os.getpid()}-{random.getrandbits(24):06x}"
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if full:
+                    message = dict(message, headers=list(message.get("headers", [])) +
+                                   [(b"x-surveyjs-profile-id", report_id.encode())])
+            await send(message)
+
+        profile = None
+        if full:
+            self._profiling = True
+            profile = cProfile.Profile()
+            profile.enable()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+                trace.add_profile(profile)
+            current_trace.reset(token)
+            if trigger is not None or elapsed >= self.threshold:
+                report = {
+                    "id": report_id,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "query": scope.get("query_string", b"").decode("latin-1"),
+                    "status": status,
+                    "ms": elapsed * 1000,
+                    "trigger": trigger or "threshold",
+                    # The event loop profile also sees other requests that ran concurrently
+                    "profiled": full
+                }
+                report.update(trace.report())
+                self.store.add(report)
@@ -0,0 +1,176 @@
+import struct
+import zlib
+from typing import List, Dict, Any, Iterator
+
+# How result payloads can be stored
+RESULT_FORMATS = ("json", "binary")
+
+# First byte of every binary payload; JSON text never starts with it
+FORMAT_VERSION = 0xB1
+FLAG_ZLIB = 0x01
+
+# Value tags. Small non-negative integers and short strings carry their value
+# or length in the tag byte itself, the way MessagePack's fixint/fixstr do.
+SMALL_INT_LIMIT = 0x60
+NULL = 0x60
+FALSE = 0x61
+TRUE = 0x62
+INT = 0x63
+FLOAT = 0x64
+STRING = 0x65
+ARRAY = 0x66
+OBJECT = 0x67
+SHORT_STRING = 0x80
+SHORT_STRING_LIMIT = 0x80
+
+FLOAT64 = struct.Struct(">d")
+
+class UnknownKeyIndex(LookupError):
+    """A payload refers to a dictionary key the decoder was not given"""
+
+def write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(data: bytes, position: int) -> tuple:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+def write_string(out: bytearray, text: str):
+    encoded = text.encode()
+    if len(encoded) < SHORT_STRING_LIMIT:
+        out.append(SHORT_STRING | len(encoded))
+    else:
+        out.append(STRING)
+        write_varint(out, len(encoded))
+    out += encoded
+
+def write_value(out: bytearray, value: Any, key_index: Dict[str, int]):
+    # bool before int: True is an int too
+    if value is None:
+        out.append(NULL)
+    elif value is True:
+        out.append(TRUE)
+    elif value is False:
+        out.append(FALSE)
+    elif isinstance(value, int):
+        if 0 <= value < SMALL_INT_LIMIT:
+            out.append(value)
+        else:
+            out.append(INT)
+            # Zigzag keeps small negative numbers short
+            write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+    elif isinstance(value, float):
+        out.append(FLOAT)
+        out += FLOAT64.pack(value)
+    elif isinstance(value, str):
+        write_string(out, value)
+    elif isinstance(value, list):
+        out.append(ARRAY)
+        write_varint(out, len(value))
+        for item in value:
+            write_value(out, item, key_index)
+    elif isinstance(value, dict):
+        out.append(OBJECT)
+        write_varint(out, len(value))
+        for key, item in value.items():
+            index = key_index.get(key)
+            if index is None:
+                # Keys outside the dictionary are written inline: odd varint = length
+                encoded = key.encode()
+                write_varint(out, len(encoded) * 2 + 1)
+                out += encoded
+            else:
+                write_varint(out, index * 2)
+            write_value(out, item, key_index)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__} in a result payload")
+
+def read_value(data: bytes, position: int, keys: List[str]) -> tuple:
+    tag = data[position]
+    position += 1
+    if tag < SMALL_INT_LIMIT:
+        return tag, position
+    if tag >= SHORT_STRING:
+        end = position + (tag - SHORT_STRING)
+        return data[position:end].decode(), end
+    if tag == NULL:
+        return None, position
+    if tag == TRUE:
+        return True, position
+    if tag == FALSE:
+        return False, position
+    if tag == INT:
+        zigzag, position = read_varint(data, position)
+        return (zigzag >> 1) if not zigzag & 1 else -((zigzag + 1) >> 1), position
+    if tag == FLOAT:
+        return FLOAT64.unpack_from(data, position)[0], position + 8
+    if tag == STRING:
+        length, position = read_varint(data, position)
+        return data[position:position + length].decode(), position + length
+    if tag == ARRAY:
+        count, position = read_varint(data, position)
+        items = []
+        for _ in range(count):
+            item, position = read_value(data, position, keys)
+            items.append(item)
+        return items, position
+    if tag == OBJECT:
+        count, position = read_varint(data, position)
+        members = {}
+        for _ in range(count):
+            reference, position = read_varint(data, position)
+            if reference & 1:
+                end = position + (reference >> 1)
+                key = data[position:end].decode()
+                position = end
+            else:
+                index = reference >> 1
+                if index >= len(keys):
+                    raise UnknownKeyIndex(index)
+                key = keys[index]
+            members[key], position = read_value(data, position, keys)
+        return members, position
+    raise ValueError(f"Unknown tag 0x{tag:02x} in result payload")
+
+def object_keys(value: Any) -> Iterator[str]:
+    """Every object key in a decoded payload, nested ones included"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield key
+            yield from object_keys(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from object_keys(item)
+
+def encode(value: Any, key_index: Dict[str, int], compression: int = 0) -> bytes:
+    """Binary payload of a decoded result; keys found in key_index are stored as their index"""
+    body = bytearray()
+    write_value(body, value, key_index)
+    flags = 0
+    if compression:
+        compressed = zlib.compress(bytes(body), compression)
+        # Short payloads often grow under zlib; keep whichever is smaller
+        if len(compressed) < len(body):
+            body = compressed
+            flags |= FLAG_ZLIB
+    return bytes((FORMAT_VERSION, flags)) + bytes(body)
+
+def decode(data: bytes, keys: List[str]) -> Any:
+    """Decoded result of a binary payload; keys[i] is the key stored as index i"""
+    if data[0] != FORMAT_VERSION:
+        raise ValueError("Not a binary result payload")
+    body = data[2:]
+    if data[1] & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    value, _ = read_value(body, 0, keys)
+    return value
@@ -0,0 +1,67 @@
+import csv
+import io
+import jsonutil
+from typing import List, Any, AsyncIterator
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+def format_ndjson(rows: List[tuple]) -> str:
+    """One stored payload per line; payloads are already JSON so nothing is re-encoded"""
+    return "".join(row[2] + "\n" for row in rows)
+
+def csv_cell(value: Any) -> Any:
+    """Flatten an answer into a CSV cell; nested answers are written as compact UTF-8 JSON"""
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return jsonutil.dumps(value)
+    return value
+
+class CsvFormatter:
+    """Write response rows as CSV with one column per question"""
+
+    def __init__(self, columns: List[str]):
+        self.columns = columns
+
+    def _write(self, records: List[List[Any]]) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(records)
+        return buffer.getvalue()
+
+    def header(self) -> str:
+        return self._write([["seq", "created_at"] + self.columns])
+
+    def format(self, rows: List[tuple]) -> str:
+        records = []
+        for seq, created_at, payload in rows:
+            answers = jsonutil.loads(payload)
+            if not isinstance(answers, dict):
+                answers = {}
+            records.append([seq, created_at] + [csv_cell(answers.get(column)) for column in self.columns])
+        return self._write(records)
+
+def record_keys(rows: List[tuple]) -> List[str]:
+    """Answer keys seen in a batch, used as CSV columns when the survey is unknown"""
+    keys = {}
+    for row in rows:
+        answers = jsonutil.loads(row[2])
+        if isinstance(answers, dict):
+            keys.update(dict.fromkeys(answers))
+    return list(keys)
+
+async def ndjson_stream(batches: AsyncIterator[List[tuple]]) -> AsyncIterator[str]:
+    async for rows in batches:
+        yield format_ndjson(rows)
+
+async def csv_stream(columns: List[str], batches: AsyncIterator[List[tuple]]) -> AsyncIterator[str]:
+    formatter = None
+    async for rows in batches:
+        if formatter is None:
+            formatter = CsvFormatter(columns or record_keys(rows))
+            yield formatter.header()
+        yield formatter.format(rows)
+    if formatter is None:
+        yield CsvFormatter(columns).header()
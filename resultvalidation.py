@@ -0,0 +1,188 @@
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable, Hashable
+from aggregation import choice_value, rating_scale, answer_key, as_number
+from surveyschema import load_survey_json, iter_questions, value_name
+
+# What /api/post does with answers that do not fit the survey definition
+VALIDATION_MODES = ("off", "strip", "reject")
+
+# Survey-level property of a definition that overrides the default result size limit
+SIZE_LIMIT_PROPERTY = "maxResultBytes"
+
+# Question options under which SurveyJS stores answers outside the listed choices
+OPEN_CHOICE_OPTIONS = ("hasOther", "showOtherItem", "hasNone", "showNoneItem", "choicesByUrl",
+                       "choicesFromQuestion", "hasSelectAll", "showSelectAllItem", "storeOthersAsComment")
+
+class ResultRejected(ValueError):
+    """A submission does not fit its survey; status is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+def is_scalar(value: Any) -> bool:
+    return isinstance(value, (str, int, float)) and not isinstance(value, bool)
+
+def choice_keys(items: List[Any]) -> frozenset:
+    return frozenset(answer_key(choice_value(item)) for item in items or [])
+
+def single_choice(allowed: frozenset) -> Callable[[Any], bool]:
+    return lambda value: not isinstance(value, (dict, list)) and answer_key(value) in allowed
+
+def multiple_choice(allowed: Optional[frozenset]) -> Callable[[Any], bool]:
+    def check(value: Any) -> bool:
+        if not isinstance(value, list):
+            return False
+        return allowed is None or all(not isinstance(item, (dict, list)) and answer_key(item) in allowed
+                                      for item in value)
+    return check
+
+def matrix(rows: frozenset, columns: frozenset) -> Callable[[Any], bool]:
+    def check(value: Any) -> bool:
+        if not isinstance(value, dict):
+            return False
+        return all(row in rows and (not columns or (not isinstance(cell, (dict, list)) and answer_key(cell) in columns))
+                   for row, cell in value.items())
+    return check
+
+def text_items(items: frozenset) -> Callable[[Any], bool]:
+    return lambda value: isinstance(value, dict) and all(
+        key in items and (cell is None or is_scalar(cell)) for key, cell in value.items())
+
+def text(max_length: Optional[int]) -> Callable[[Any], bool]:
+    if max_length:
+        return lambda value: is_scalar(value) and len(str(value)) <= max_length
+    return is_scalar
+
+def anything(value: Any) -> bool:
+    return True
+
+def generated_numbers(question: Dict[str, Any]) -> Optional[Callable[[Any], bool]]:
+    """Check for the numbers a dropdown lists from choicesMin to choicesMax by choicesStep, or None"""
+    low = as_number(question.get("choicesMin"), 0)
+    high = as_number(question.get("choicesMax"), 0)
+    step = as_number(question.get("choicesStep"), 1) or 1
+    if low is None or high is None or step is None or high <= low or step <= 0:
+        return None
+    return on_grid(low, high, step)
+
+def on_grid(low: Any, high: Any, step: Any) -> Callable[[Any], bool]:
+    """Check for a number (or numeric string) from low to high in steps of step, without listing them"""
+    # Tolerates the rounding of SurveyJS adding a fractional step repeatedly
+    tolerance = step * 1e-9
+
+    def check(value: Any) -> bool:
+        if isinstance(value, (bool, dict, list)):
+            return False
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return False
+        steps = (number - low) / step
+        return low - tolerance <= number <= high + tolerance and abs(steps - round(steps)) * step <= tolerance
+    return check
+
+def compile_question(question: Dict[str, Any]) -> Callable[[Any], bool]:
+    """Check for one question's answer, built from its definition"""
+    question_type = question.get("type")
+    open_choices = any(question.get(option) for option in OPEN_CHOICE_OPTIONS)
+    if question_type in ("radiogroup", "dropdown", "imagepicker"):
+        if question.get("multiSelect"):
+            return multiple_choice(None if open_choices else choice_keys(question.get("choices")))
+        if open_choices:
+            return anything
+        listed = single_choice(choice_keys(question.get("choices")))
+        generated = generated_numbers(question) if question_type == "dropdown" else None
+        if generated is None:
+            return listed
+        return lambda value: listed(value) or generated(value)
+    if question_type in ("checkbox", "tagbox", "ranking"):
+        return multiple_choice(None if open_choices else choice_keys(question.get("choices")))
+    if question_type == "boolean":
+        if "valueTrue" in question or "valueFalse" in question:
+            return single_choice(frozenset(answer_key(question.get(key, default))
+                                           for key, default in (("valueTrue", True), ("valueFalse", False))))
+        return lambda value: isinstance(value, bool)
+    if question_type == "rating":
+        rate_values = question.get("rateValues")
+        if rate_values:
+            return single_choice(choice_keys(rate_values)) if isinstance(rate_values, list) else anything
+        scale = rating_scale(question)
+        # A scale SurveyJS could not render either is not held against the answers
+        return anything if scale is None else on_grid(*scale)
+    if question_type == "matrix":
+        return matrix(choice_keys(question.get("rows")), choice_keys(question.get("columns")))
+    if question_type == "multipletext":
+        return text_items(frozenset(item.get("name") for item in question.get("items") or []
+                                    if isinstance(item, dict)))
+    if question_type in ("text", "comment"):
+        return text(question.get("maxLength"))
+    # Dynamic panels, dropdown matrices, files, signatures, expressions, custom types: structure not checked
+    return anything
+
+class ResultValidator:
+    """A survey definition compiled into one answer check per result key"""
+
+    def __init__(self, survey: Dict[str, Any], max_bytes: int = 0):
+        self.checks: Dict[str, Callable[[Any], bool]] = {}
+        for question in iter_questions(survey):
+            name = value_name(question)
+            if name in self.checks:
+                continue
+            self.checks[name] = compile_question(question)
+            if question.get("hasComment") or question.get("showCommentArea") or any(
+                    question.get(option) for option in ("hasOther", "showOtherItem")):
+                # Comment and "other" text are stored next to the answer
+                self.checks[f"{name}-Comment"] = is_scalar
+        limit = survey.get(SIZE_LIMIT_PROPERTY)
+        self.max_bytes = limit if isinstance(limit, int) and not isinstance(limit, bool) and limit > 0 else max_bytes
+
+    def check_size(self, size: int):
+        if self.max_bytes and size > self.max_bytes:
+            raise ResultRejected(f"Result is {size} bytes; this survey accepts at most {self.max_bytes}", 413)
+
+    def validate(self, result: Dict[str, Any], mode: str) -> Dict[str, Any]:
+        """The result with unknown or invalid answers removed ("strip"), or ResultRejected ("reject")"""
+        if mode == "off" or not self.checks:
+            return result
+        kept = {}
+        for key, value in result.items():
+            check = self.checks.get(key)
+            # Unanswered questions may be sent as null
+            if check is not None and (value is None or check(value)):
+                kept[key] = value
+            elif mode == "reject":
+                problem = "is not a question of this survey" if check is None else "has an invalid answer"
+                raise ResultRejected(f"{key} {problem}")
+        return kept
+
+class ValidatorCache:
+    """Compiled validators per survey id, rebuilt only when the survey version changes"""
+
+    def __init__(self, max_bytes: int = 0, maxsize: int = 1024):
+        self.max_bytes = max_bytes
+        self.maxsize = maxsize
+        # survey id -> (survey version, validator); versions are never reused, even across a delete
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Results for surveys that do not exist are only held to the default size limit
+        self.default = ResultValidator({}, max_bytes)
+
+    def get(self, survey_id: Hashable, survey: Optional[Dict[str, Any]]) -> ResultValidator:
+        """Validator for a survey entry as returned by get_survey_entry"""
+        if survey is None:
+            return self.default
+        version = survey["version"]
+        with self._lock:
+            entry = self._entries.get(survey_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(survey_id)
+                return entry[1]
+        validator = ResultValidator(load_survey_json(survey["json"]), self.max_bytes)
+        with self._lock:
+            self._entries[survey_id] = (version, validator)
+            self._entries.move_to_end(survey_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return validator
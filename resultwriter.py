@@ -0,0 +1,99 @@
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import Future
+from typing import List, Tuple, Callable, Any
+from profiling import TraceGroup, current_trace
+
+class ResultWriter:
+    """Single writer thread that group-commits result submissions
+
+    Callers enqueue ready-to-insert rows and get a Future back. The writer
+    drains whatever is queued (up to max_batch rows), inserts it in one
+    transaction and resolves every Future once the commit has succeeded, so
+    concurrent posts never contend for the SQLite write lock. write_batch
+    returns one status per row; each Future resolves to the statuses of the
+    rows it submitted.
+    """
+
+    def __init__(self, write_batch: Callable[[List[Tuple]], List[Any]], max_batch: int = 512):
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="surveyjs-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, rows: List[Tuple]) -> Future:
+        """Queue rows for the next group commit; they are never split across transactions"""
+        future = Future()
+        # The caller's profiling trace, if any, also receives the statements of its group commit
+        self._queue.put((rows, future, current_trace.get()))
+        return future
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            row_count = len(item[0])
+            stop = False
+            while row_count < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+                row_count += len(item[0])
+
+            # Posts whose request was cancelled while queued are not written; the rest can no longer be cancelled
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if batch:
+                self._commit(batch, sum(len(rows) for rows, _, _ in batch))
+            if stop:
+                return
+
+    def _commit(self, batch: List[tuple], row_count: int):
+        """Write one group and resolve its Futures; never raises, so the writer thread survives"""
+        try:
+            statuses = self._write(batch, row_count)
+        except Exception as e:
+            for _, future, _ in batch:
+                self._resolve(future, exception=e)
+        else:
+            offset = 0
+            for rows, future, _ in batch:
+                self._resolve(future, result=statuses[offset:offset + len(rows)])
+                offset += len(rows)
+
+    def _resolve(self, future: Future, result: Any = None, exception: Exception = None):
+        try:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+        except Exception:
+            traceback.print_exc()
+
+    def _write(self, batch: List[tuple], row_count: int) -> List[Any]:
+        """Write one group, recording it in the profiling traces of the requests it serves"""
+        traces = [trace for _, _, trace in batch if trace is not None]
+        if not traces:
+            return self.write_batch([row for rows, _, _ in batch for row in rows])
+        group = TraceGroup(traces)
+        token = current_trace.set(group)
+        started = time.perf_counter()
+        try:
+            return self.write_batch([row for rows, _, _ in batch for row in rows])
+        finally:
+            group.add_span(f"writer.batch[{row_count} rows]", time.perf_counter() - started)
+            current_trace.reset(token)
+
+    def close(self):
+        """Flush queued rows and stop the writer thread"""
+        self._queue.put(None)
+        self._thread.join()
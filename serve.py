@@ -0,0 +1,224 @@
+"""Production launcher: a pre-forked pool of uvicorn workers sharing one listening socket
+
+The parent process imports the application once, creates or migrates the
+database, binds the socket and forks the workers, which inherit all three.
+Each worker opens its own SQLite connections in the lifespan hook, so no
+connection ever crosses a fork.
+
+Signals to the parent:
+  SIGTERM, SIGINT  stop: workers finish in-flight requests, then exit
+  SIGHUP           graceful restart: workers are replaced one at a time
+  SIGTTIN, SIGTTOU one worker more / fewer
+
+    python serve.py --workers 4 --port 8000
+"""
+import argparse
+import os
+import select
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import Dict, List, Optional
+
+import uvicorn
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+try:
+    import httptools
+except ImportError:
+    httptools = None
+
+def env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run the SurveyJS service with several worker processes")
+    parser.add_argument("--host", default=os.environ.get("SURVEYJS_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=env_int("SURVEYJS_PORT", 8000))
+    parser.add_argument("--workers", type=int, default=env_int("SURVEYJS_WORKERS", os.cpu_count() or 1),
+                        help="Worker processes (default: number of CPUs)")
+    parser.add_argument("--backlog", type=int, default=env_int("SURVEYJS_BACKLOG", 2048),
+                        help="Listen queue length of the shared socket")
+    parser.add_argument("--graceful-timeout", type=int, default=env_int("SURVEYJS_GRACEFUL_TIMEOUT", 30),
+                        help="Seconds a stopping worker gets to finish its requests before it is killed")
+    parser.add_argument("--keep-alive", type=int, default=env_int("SURVEYJS_KEEP_ALIVE", 5),
+                        help="Seconds an idle HTTP keep-alive connection stays open")
+    parser.add_argument("--access-log", action="store_true", default=os.environ.get("SURVEYJS_ACCESS_LOG") == "1")
+    return parser.parse_args(argv)
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def prepare_storage(service):
+    """Create, migrate and seed the database once, before any worker can race on it"""
+    if service.STORAGE_ENGINE == "sqlite":
+        service.open_database()
+        service.close_database()
+
+# Signals the parent handles
+SIGNALS = (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU, signal.SIGCHLD)
+
+class Arbiter:
+    """Forks the workers, replaces the ones that die and relays signals to them"""
+
+    FAST_EXIT = 2.0
+
+    def __init__(self, service, sock: socket.socket, args):
+        self.service = service
+        self.sock = sock
+        self.args = args
+        self.size = args.workers
+        # pid -> start time
+        self.workers: Dict[int, float] = {}
+        self.pending: List[int] = []
+        # Workers in a row that exited within FAST_EXIT seconds of starting
+        self.fast_exits = 0
+        # Signals write a byte here, so waiting for one cannot miss a signal that just arrived
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        os.set_blocking(self.wakeup_read, False)
+        os.set_blocking(self.wakeup_write, False)
+
+    def config(self) -> uvicorn.Config:
+        return uvicorn.Config(
+            self.service.app,
+            loop="uvloop" if uvloop is not None else "asyncio",
+            http="httptools" if httptools is not None else "h11",
+            lifespan="on",
+            access_log=self.args.access_log,
+            timeout_keep_alive=self.args.keep_alive,
+            timeout_graceful_shutdown=self.args.graceful_timeout,
+        )
+
+    def spawn(self) -> int:
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            return pid
+        # Worker: uvicorn installs its own SIGINT/SIGTERM handlers for a graceful shutdown
+        signal.set_wakeup_fd(-1)
+        for signum in SIGNALS:
+            signal.signal(signum, signal.SIG_DFL)
+        os.close(self.wakeup_read)
+        os.close(self.wakeup_write)
+        code = 0
+        try:
+            uvicorn.Server(self.config()).run(sockets=[self.sock])
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            # Never return into the parent's loop
+            os._exit(code)
+
+    def stop_worker(self, pid: int, signum: int = signal.SIGTERM):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def reap(self) -> List[int]:
+        exited = []
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            started = self.workers.pop(pid, None)
+            if started is not None:
+                self.fast_exits = self.fast_exits + 1 if time.monotonic() - started < self.FAST_EXIT else 0
+            exited.append(pid)
+        return exited
+
+    def handle(self, signum, frame):
+        self.pending.append(signum)
+
+    def restart(self):
+        """Replace every worker, starting each new one before stopping an old one"""
+        for pid in list(self.workers):
+            self.spawn()
+            self.stop_worker(pid)
+
+    def shutdown(self):
+        for pid in list(self.workers):
+            self.stop_worker(pid)
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            self.stop_worker(pid, signal.SIGKILL)
+        while self.workers:
+            self.workers.pop(os.wait()[0], None)
+
+    def run(self) -> int:
+        signal.set_wakeup_fd(self.wakeup_write)
+        for signum in SIGNALS:
+            signal.signal(signum, self.handle)
+        print(f"Serving on {self.args.host}:{self.args.port} with {self.size} worker(s) "
+              f"(loop={'uvloop' if uvloop else 'asyncio'}, http={'httptools' if httptools else 'h11'})",
+              file=sys.stderr)
+        while True:
+            while len(self.workers) < self.size:
+                self.spawn()
+            # Sleep until a signal arrives; SIGCHLD wakes us when a worker exits
+            if not self.pending:
+                select.select([self.wakeup_read], [], [], 1.0)
+            try:
+                os.read(self.wakeup_read, 4096)
+            except BlockingIOError:
+                pass
+            while self.pending:
+                signum = self.pending.pop(0)
+                if signum in (signal.SIGTERM, signal.SIGINT):
+                    self.shutdown()
+                    return 0
+                if signum == signal.SIGHUP:
+                    self.restart()
+                elif signum == signal.SIGTTIN:
+                    self.size += 1
+                elif signum == signal.SIGTTOU and self.size > 1:
+                    self.size -= 1
+                    self.stop_worker(max(self.workers, key=self.workers.get))
+            self.reap()
+            # Workers that die right after starting (e.g. a broken app) would respawn in a loop
+            if self.fast_exits >= 2 * self.size + 1:
+                print("Workers keep exiting right after starting; giving up", file=sys.stderr)
+                self.shutdown()
+                return 1
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    import main as service
+    if service.STORAGE_ENGINE == "memory" and args.workers > 1:
+        print("The memory storage engine cannot be shared between workers; use --workers 1", file=sys.stderr)
+        return 2
+    tuning = service.storage_options.get("tuning")
+    if args.workers > 1 and tuning is not None:
+        # Every worker has its own connections, so SQLite's file locks are all that coordinates them
+        if (tuning.journal_mode or "").upper() != "WAL":
+            print("Without WAL, readers in one worker block commits in the others; "
+                  "consider SURVEYJS_DB_PROFILE=wal", file=sys.stderr)
+        if not tuning.busy_timeout:
+            print("Without a busy timeout, concurrent writes from several workers fail with "
+                  "'database is locked'; set SURVEYJS_DB_BUSY_TIMEOUT", file=sys.stderr)
+    prepare_storage(service)
+    sock = bind_socket(args.host, args.port, args.backlog)
+    return Arbiter(service, sock, args).run()
+
+if __name__ == "__main__":
+    sys.exit(main())
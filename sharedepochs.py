@@ -0,0 +1,63 @@
+import fcntl
+import mmap
+import os
+import struct
+import zlib
+from typing import Hashable
+
+# One 64-bit counter per slot
+SLOT = struct.Struct("<Q")
+
+class EpochTable:
+    """Change counters shared by every process that maps the same file
+
+    Keys are hashed onto a fixed number of slots. A writer bumps the slot of a
+    key after committing a change; readers compare the slot with the value they
+    saw when they cached the key, which costs one read from shared memory and no
+    system call. Keys that share a slot only cause extra reloads, never stale
+    reads.
+    """
+
+    def __init__(self, path: str, slots: int = 4096):
+        self.path = path
+        self.slots = slots
+        size = slots * SLOT.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # lockf locks belong to the process, so this also works on a descriptor inherited through fork
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size < size:
+                    os.ftruncate(fd, size)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+            self._map = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def slot(self, key: Hashable) -> int:
+        """Offset of key's counter; callers that check a key often can keep it"""
+        return zlib.crc32(str(key).encode()) % self.slots * SLOT.size
+
+    def read(self, slot: int) -> int:
+        """Current change counter at a slot offset"""
+        return SLOT.unpack_from(self._map, slot)[0]
+
+    def get(self, key: Hashable) -> int:
+        """Current change counter of key's slot"""
+        return self.read(self.slot(key))
+
+    def bump(self, key: Hashable):
+        """Tell every process that key changed"""
+        offset = self.slot(key)
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, SLOT.size, offset)
+        try:
+            SLOT.pack_into(self._map, offset, SLOT.unpack_from(self._map, offset)[0] + 1)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, SLOT.size, offset)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
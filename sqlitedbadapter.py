@@ -1,23 +1,128 @@
 import sqlite3
 import json
 import copy
-from demo_surveys import demo_data
-from typing import List, Dict, Any, Optional
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future
+from connectionpool import ConnectionPool, StorageTuning
+from resultwriter import ResultWriter
+from surveycache import SurveyCache
+from surveyschema import load_survey_json
+from surveypatch import VersionConflict, apply_patch, revision_data, replay
+from surveyids import ID_STRATEGIES, new_ulid
+from storage import demo_rows, load_demo_data, post_batch, results_json, results_page, results_page_json, iter_rows
+from profiling import json_timer
+import jsonutil
+import resultcodec
+from aggregation import describe_questions, sql_histograms, summarize, answer_histograms, counter_rows
+from typing import List, Dict, Any, Optional, Iterator
+
+# Bumped whenever init_database gains a migration step
+SCHEMA_VERSION = 9
+
+# API field name -> surveys column, for projected survey listings
+SURVEY_FIELDS = {
+    "id": "id",
+    "name": "name",
+    "json": "json_data"
+}
 
 class SQLiteDBAdapter:
-    def __init__(self, db_path: str = "surveyjs.db"):
+    def __init__(self, db_path: str = "surveyjs.db", pool_size: int = 5,
+                 tuning: Optional[StorageTuning] = None, group_commit: bool = False,
+                 counters: bool = False, survey_cache: Optional[SurveyCache] = None,
+                 id_strategy: str = "sequence", connection_factory: type = sqlite3.Connection,
+                 result_format: str = "json", result_compression: int = 0, seed_demo: bool = False,
+                 revision_snapshot_interval: int = 20):
+        if id_strategy not in ID_STRATEGIES:
+            raise ValueError(f"Unknown survey id strategy: {id_strategy}")
+        if result_format not in resultcodec.RESULT_FORMATS:
+            raise ValueError(f"Unknown result format: {result_format}")
         self.db_path = db_path
+        # "sequence" keeps the numeric string ids; "ulid" needs no shared counter at all
+        self.id_strategy = id_strategy
+        self.survey_cache = survey_cache
+        # Maintain per-question answer counters on ingest and serve statistics from them
+        self.counters = counters
+        self._questions = {}
+        # New results are stored as JSON text or as dictionary-coded binary (zlib level when compressed);
+        # reads accept both, so the format can change without converting existing rows
+        self.result_format = result_format
+        self.result_compression = result_compression
+        # post_id -> (keys, key -> index) of committed result key dictionaries
+        self._result_keys = {}
+        # Survey revisions store a full definition after this many deltas in a row
+        self.revision_snapshot_interval = max(1, revision_snapshot_interval)
+        self.pool = ConnectionPool(db_path, size=pool_size, tuning=tuning, factory=connection_factory)
+        self._local = threading.local()
         self.init_database()
-        self.populate_demo_data()
+        if seed_demo:
+            self.populate_demo_data()
+        # Serialize result inserts through one writer thread that commits them in groups
+        self.writer = ResultWriter(self.insert_responses) if group_commit else None
 
+    @contextmanager
     def get_connection(self):
-        """Get a database connection"""
-        return sqlite3.connect(self.db_path)
+        """Get a database connection
+        
+        The connection is bound to the current thread while the block runs, so
+        adapter methods called inside it reuse the same connection and
+        transaction. It is committed when the outermost block exits and rolled
+        back if it raises.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+        with self.pool.connection() as conn:
+            self._local.conn = conn
+            self._local.after_commit = []
+            try:
+                with conn:
+                    yield conn
+            finally:
+                self._local.conn = None
+                for callback in self._local.after_commit:
+                    callback()
+
+    def after_commit(self, callback):
+        """Run callback once the current transaction has finished"""
+        if getattr(self._local, "conn", None) is None:
+            callback()
+        else:
+            self._local.after_commit.append(callback)
+
+    def invalidate_survey(self, survey_id: str):
+        """Drop a survey from the cache once the change is committed"""
+        if self.survey_cache is not None:
+            self.after_commit(lambda: self.survey_cache.invalidate(survey_id))
+
+    def transaction(self):
+        """Share one connection and transaction across several adapter calls"""
+        return self.get_connection()
+
+    def close(self):
+        """Flush pending writes and close pooled connections"""
+        if self.writer is not None:
+            self.writer.close()
+        self.pool.close()
 
     def init_database(self):
         """Initialize the database with required tables"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            cursor.execute('PRAGMA user_version')
+            # An up-to-date database needs no DDL, so normal starts stay read-only
+            if cursor.fetchone()[0] >= SCHEMA_VERSION:
+                return
+            # Workers starting together on a new database all get here; the write lock lets
+            # one of them apply every step, and the others then see its user_version
+            self.begin_immediate(conn)
+            cursor.execute('PRAGMA user_version')
+            version = cursor.fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                return
             
             # Create surveys table
             cursor.execute('''
@@ -28,7 +133,7 @@ class SQLiteDBAdapter:
                 )
             ''')
             
-            # Create results table
+            # Create legacy results table (one JSON array per post id)
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS results (
                     id TEXT PRIMARY KEY,
@@ -36,92 +141,319 @@ class SQLiteDBAdapter:
                 )
             ''')
             
-            conn.commit()
+            # Create responses table (one row per submission)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    seq INTEGER PRIMARY KEY,
+                    post_id TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    payload TEXT NOT NULL
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS responses_post_id_seq
+                ON responses (post_id, seq)
+            ''')
+            
+            if version < 1:
+                self.migrate_results_table(cursor)
+            if version < 2:
+                # Client-provided submission ids make re-uploads idempotent
+                cursor.execute('ALTER TABLE responses ADD COLUMN submission_id TEXT')
+                cursor.execute('''
+                    CREATE UNIQUE INDEX IF NOT EXISTS responses_submission_id
+                    ON responses (post_id, submission_id) WHERE submission_id IS NOT NULL
+                ''')
+            if version < 3:
+                self.create_counter_tables(cursor)
+            if version < 4:
+                self.add_survey_versions(cursor)
+            if version < 5:
+                # Name-prefix search in get_surveys
+                cursor.execute('CREATE INDEX IF NOT EXISTS surveys_name ON surveys (name)')
+            if version < 6:
+                self.create_survey_id_sequence(cursor)
+            if version < 7:
+                self.create_result_keys(cursor)
+            if version < 8:
+                self.create_survey_revisions(cursor)
+            if version < 9:
+                self.create_survey_version_sequence(cursor)
+            if version < SCHEMA_VERSION:
+                cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def begin_immediate(self, conn):
+        """Take the write lock now, so a check made in this transaction still holds when it writes"""
+        # Python's sqlite3 runs DDL outside any transaction unless one was begun explicitly
+        if not conn.in_transaction:
+            conn.execute('BEGIN IMMEDIATE')
+
+    def migrate_results_table(self, cursor):
+        """Move legacy JSON-array results into the responses table"""
+        cursor.execute('SELECT id, data FROM results ORDER BY rowid')
+        now = time.time()
+        for post_id, data in cursor.fetchall():
+            rows = [(post_id, now, json.dumps(result)) for result in json.loads(data or '[]')]
+            cursor.executemany('''
+                INSERT INTO responses (post_id, created_at, payload)
+                VALUES (?, ?, ?)
+            ''', rows)
+        cursor.execute('DELETE FROM results')
 
-    def populate_demo_data(self):
-        """Populate the database with demo data if it's empty"""
+    def add_survey_versions(self, cursor):
+        """Version surveys and the survey list so HTTP responses can carry ETags"""
+        cursor.execute('ALTER TABLE surveys ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('catalog_version', 1)")
+        # Any change to the surveys table, from any connection, bumps the catalog version
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS surveys_catalog_{event.lower()}
+                AFTER {event} ON surveys
+                BEGIN
+                    UPDATE meta SET value = value + 1 WHERE key = 'catalog_version';
+                END
+            ''')
+
+    def create_survey_id_sequence(self, cursor):
+        """Keep the last numeric survey id in meta so add_survey never scans surveys"""
+        # Seeded once with the value the old MAX(CAST(id AS INTEGER)) allocation would see
+        cursor.execute('''
+            INSERT OR IGNORE INTO meta (key, value)
+            SELECT 'survey_id_seq', COALESCE(MAX(CAST(id AS INTEGER)), 0) FROM surveys
+        ''')
+        # Numeric ids inserted directly (demo data, changeJson on a new id) advance the sequence
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS surveys_id_seq
+            AFTER INSERT ON surveys
+            WHEN NEW.id GLOB '[1-9]*' AND NEW.id NOT GLOB '*[^0-9]*' AND length(NEW.id) <= 15
+            BEGIN
+                UPDATE meta SET value = MAX(value, CAST(NEW.id AS INTEGER)) WHERE key = 'survey_id_seq';
+            END
+        ''')
+
+    def create_result_keys(self, cursor):
+        """Create the per-post key dictionaries of binary result payloads"""
+        # Indexes only ever grow, so a payload encoded against an older dictionary stays readable
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS result_keys (
+                post_id TEXT NOT NULL,
+                key_index INTEGER NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (post_id, key_index),
+                UNIQUE (post_id, key)
+            )
+        ''')
+
+    def create_survey_revisions(self, cursor):
+        """Create the history of survey definitions: JSON Patch deltas with periodic full snapshots"""
+        # depth counts the deltas since the last snapshot (0 = data is the full definition)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS survey_revisions (
+                survey_id TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                depth INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (survey_id, version)
+            )
+        ''')
+
+    def create_survey_version_sequence(self, cursor):
+        """Keep the last survey version handed out in meta, so versions never repeat for an id"""
+        # Every version bump also bumped catalog_version, so no survey has had a larger version yet
+        cursor.execute('''
+            INSERT OR IGNORE INTO meta (key, value)
+            SELECT 'survey_version_seq', MAX(COALESCE((SELECT MAX(version) FROM surveys), 0), value)
+            FROM meta WHERE key = 'catalog_version'
+        ''')
+
+    def increment_meta(self, cursor, key: str) -> int:
+        """Add one to a meta counter in the current transaction and return the new value"""
+        # UPDATE ... RETURNING would need SQLite 3.35; the UPDATE holds the write lock until commit,
+        # so no other connection can move the counter before the SELECT reads it back
+        cursor.execute("UPDATE meta SET value = value + 1 WHERE key = ?", (key,))
+        cursor.execute("SELECT value FROM meta WHERE key = ?", (key,))
+        return cursor.fetchone()[0]
+
+    def next_version(self, cursor) -> int:
+        """A survey version no survey has had before, so a deleted and recreated survey gets new ETags"""
+        return self.increment_meta(cursor, 'survey_version_seq')
+
+    def create_counter_tables(self, cursor):
+        """Create the materialized answer counters used by incremental statistics"""
+        # A post's counters are current only while it has a row here whose
+        # through_seq is the newest response sequence number of that post
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS response_counts (
+                post_id TEXT PRIMARY KEY,
+                responses INTEGER NOT NULL,
+                through_seq INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS question_counters (
+                post_id TEXT NOT NULL,
+                question TEXT NOT NULL,
+                answered INTEGER NOT NULL,
+                PRIMARY KEY (post_id, question)
+            )
+        ''')
+        # answer has no declared type so 5, 5.0 and "5" keep the types json_extract gives them
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS answer_counters (
+                post_id TEXT NOT NULL,
+                question TEXT NOT NULL,
+                row TEXT NOT NULL,
+                answer,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (post_id, question, row, answer)
+            )
+        ''')
+
+    def populate_demo_data(self) -> bool:
+        """Populate the database with demo data if it's empty; returns whether it was seeded"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            # Another process may be seeding the same new database
+            self.begin_immediate(conn)
             
             # Check if surveys table is empty
-            cursor.execute('SELECT COUNT(*) FROM surveys')
-            survey_count = cursor.fetchone()[0]
+            cursor.execute('SELECT EXISTS (SELECT 1 FROM surveys)')
+            if cursor.fetchone()[0]:
+                return False
             
-            if survey_count == 0:
-                # Insert demo surveys
-                for survey in demo_data["surveys"]:
-                    # Convert json field to string if it's a dict
-                    json_data = survey.get("json", "{}")
-                    if isinstance(json_data, dict):
-                        json_data = json.dumps(json_data)
-                    elif not isinstance(json_data, str):
-                        json_data = "{}"
-                    
-                    cursor.execute('''
-                        INSERT INTO surveys (id, name, json_data)
-                        VALUES (?, ?, ?)
-                    ''', (survey["id"], survey["name"], json_data))
-                
-                # Insert demo results
-                for result in demo_data["results"]:
-                    cursor.execute('''
-                        INSERT INTO results (id, data)
-                        VALUES (?, ?)
-                    ''', (result["id"], json.dumps(result["data"])))
-                
-                conn.commit()
-
-    def get_surveys(self) -> List[Dict[str, Any]]:
-        """Get all surveys from the database"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT id, name, json_data FROM surveys')
+            surveys, results = demo_rows()
+            cursor.executemany('''
+                INSERT INTO surveys (id, name, json_data, version)
+                VALUES (?, ?, ?, ?)
+            ''', [survey + (self.next_version(cursor),) for survey in surveys])
+            now = time.time()
+            cursor.executemany('''
+                INSERT INTO responses (post_id, created_at, payload)
+                VALUES (?, ?, ?)
+            ''', [(post_id, now, payload) for post_id, payload in results])
+            return True
+
+    def get_surveys(self, fields: Optional[List[str]] = None, limit: Optional[int] = None,
+                    after: Optional[str] = None, name_prefix: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get surveys from the database
+        
+        fields picks the returned keys (all of id, name and json by default).
+        With limit, surveys are ordered by id and after is the last id of the
+        previous page. name_prefix matches names case-sensitively through the
+        name index.
+        """
+        fields = fields or list(SURVEY_FIELDS)
+        for field in fields:
+            if field not in SURVEY_FIELDS:
+                raise ValueError(f"Unknown survey field: {field}")
+        
+        query = f"SELECT {', '.join(SURVEY_FIELDS[field] for field in fields)} FROM surveys"
+        conditions = []
+        params = []
+        if name_prefix:
+            # A range instead of LIKE so the name index can be used
+            conditions.append('name >= ? AND name < ?')
+            params += [name_prefix, name_prefix[:-1] + chr(ord(name_prefix[-1]) + 1)]
+        if after is not None:
+            conditions.append('id > ?')
+            params.append(after)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        if limit is not None:
+            query += ' ORDER BY id LIMIT ?'
+            params.append(limit)
+        
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
             rows = cursor.fetchall()
             
             surveys = []
             for row in rows:
-                surveys.append({
-                    "id": row[0],
-                    "name": row[1],
-                    "json": row[2]
-                })
+                surveys.append(dict(zip(fields, row)))
             
             return surveys
 
     def get_survey(self, survey_id: str) -> Optional[Dict[str, Any]]:
         """Get a specific survey by ID"""
+        entry = self.get_survey_entry(survey_id)
+        if entry is None:
+            return None
+        return {
+            "id": entry["id"],
+            "name": entry["name"],
+            "json": entry["json"]
+        }
+
+    def get_survey_entry(self, survey_id: str) -> Optional[Dict[str, Any]]:
+        """Get a survey together with its version number"""
+        # Inside a transaction the caller may be looking at its own uncommitted changes
+        cache = self.survey_cache
+        if cache is None or getattr(self._local, "conn", None) is not None:
+            return self.read_survey(survey_id)
+        
+        survey = cache.get(survey_id)
+        if survey is None:
+            token = cache.token(survey_id)
+            survey = self.read_survey(survey_id)
+            if survey is None:
+                return None
+            cache.put(survey_id, survey, token)
+        return dict(survey)
+
+    def read_survey(self, survey_id: str) -> Optional[Dict[str, Any]]:
+        """Get a specific survey and its version by ID from the database"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT id, name, json_data FROM surveys WHERE id = ?', (survey_id,))
+            cursor.execute('SELECT id, name, json_data, version FROM surveys WHERE id = ?', (survey_id,))
             row = cursor.fetchone()
             
             if row:
                 return {
                     "id": row[0],
                     "name": row[1],
-                    "json": row[2]
+                    "json": row[2],
+                    "version": row[3]
                 }
             return None
 
+    def get_catalog_version(self) -> int:
+        """Version of the survey list; changes whenever any survey is added, edited or deleted"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT value FROM meta WHERE key = 'catalog_version'")
+            return cursor.fetchone()[0]
+
+    def next_survey_id(self, cursor) -> str:
+        """Allocate a survey id in the current transaction"""
+        if self.id_strategy == "ulid":
+            return new_ulid()
+        # The UPDATE takes the write lock, so concurrent creates are serialized here
+        return str(self.increment_meta(cursor, 'survey_id_seq'))
+
     def add_survey(self, name: Optional[str] = None) -> Dict[str, Any]:
         """Add a new survey to the database"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
-            # Get the next available ID
-            cursor.execute('SELECT MAX(CAST(id AS INTEGER)) FROM surveys')
-            max_id = cursor.fetchone()[0]
-            new_id = str((max_id or 0) + 1)
-            
-            new_name = name or f"{demo_data['default_name']} {new_id}"
-            
-            cursor.execute('''
-                INSERT INTO surveys (id, name, json_data)
-                VALUES (?, ?, ?)
-            ''', (new_id, new_name, "{}"))
-            
-            conn.commit()
-            
+            # Skip ids that are already taken, e.g. non-canonical ones such as "007"
+            while True:
+                new_id = self.next_survey_id(cursor)
+                new_name = name or f"{load_demo_data()['default_name']} {new_id}"
+                cursor.execute('''
+                    INSERT OR IGNORE INTO surveys (id, name, json_data, version)
+                    VALUES (?, ?, ?, ?)
+                ''', (new_id, new_name, "{}", self.next_version(cursor)))
+                if cursor.rowcount > 0:
+                    break
+
             return {
                 "id": new_id,
                 "name": new_name,
@@ -132,83 +464,480 @@ class SQLiteDBAdapter:
         """Change the name of a survey"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('UPDATE surveys SET name = ? WHERE id = ?', (name, survey_id))
-            conn.commit()
+            cursor.execute('UPDATE surveys SET name = ?, version = ? WHERE id = ?',
+                           (name, self.next_version(cursor), survey_id))
             
             if cursor.rowcount > 0:
+                self.invalidate_survey(survey_id)
                 return self.get_survey(survey_id)
             return None
 
-    def store_survey(self, survey_id: str, name: Optional[str], json_data: Optional[str]) -> Dict[str, Any]:
-        """Store or update a survey"""
+    def claim_version(self, cursor, survey_id: str, base_version: Optional[int]) -> tuple:
+        """Take a new version for a survey: (new version, current json, whether the survey exists)
+        
+        Taking the version is a write, so the database write lock is held before
+        the definition is read and the change is computed from the latest
+        committed one. With base_version, raises VersionConflict if the survey
+        was at another one.
+        """
+        version = self.next_version(cursor)
+        cursor.execute('SELECT version, json_data FROM surveys WHERE id = ?', (survey_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return version, None, False
+        if base_version is not None and row[0] != base_version:
+            raise VersionConflict(row[0])
+        cursor.execute('UPDATE surveys SET version = ? WHERE id = ?', (version, survey_id))
+        return version, row[1], True
+
+    def record_revision(self, cursor, survey_id: str, version: int, previous_json: Optional[str],
+                        json_data: Optional[str], delta: Optional[str] = None):
+        """Append a survey definition change to its revision history"""
+        cursor.execute('''
+            SELECT depth FROM survey_revisions WHERE survey_id = ? ORDER BY version DESC LIMIT 1
+        ''', (survey_id,))
+        latest = cursor.fetchone()
+        depth, data = revision_data(None if latest is None else (latest[0], previous_json), json_data, delta,
+                                    self.revision_snapshot_interval)
+        cursor.execute('''
+            INSERT INTO survey_revisions (survey_id, version, created_at, depth, data)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (survey_id, version, time.time(), depth, data))
+
+    def store_survey(self, survey_id: str, name: Optional[str], json_data: Optional[str],
+                     base_version: Optional[int] = None) -> Dict[str, Any]:
+        """Store or update a survey; with base_version, only if it is still at that version"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
-            # Check if survey exists
-            cursor.execute('SELECT id FROM surveys WHERE id = ?', (survey_id,))
-            exists = cursor.fetchone()
-            
+            version, previous_json, exists = self.claim_version(cursor, survey_id, base_version)
             if exists:
                 # Update existing survey
-                cursor.execute('''
-                    UPDATE surveys 
-                    SET json_data = ?
-                    WHERE id = ?
-                ''', (json_data, survey_id))
+                cursor.execute('UPDATE surveys SET json_data = ? WHERE id = ?', (json_data, survey_id))
+            elif base_version is not None:
+                # The edit was based on a survey that has since been deleted
+                raise VersionConflict(None)
             else:
                 # Create new survey
                 survey_name = name or str(survey_id)
                 cursor.execute('''
-                    INSERT INTO surveys (id, name, json_data)
-                    VALUES (?, ?, ?)
-                ''', (survey_id, survey_name, json_data))
+                    INSERT INTO surveys (id, name, json_data, version)
+                    VALUES (?, ?, ?, ?)
+                ''', (survey_id, survey_name, json_data, version))
+            self.record_revision(cursor, survey_id, version, previous_json, json_data)
             
-            conn.commit()
-            return self.get_survey(survey_id)
+            # Question types may have changed; counters are rebuilt on the next statistics read
+            self.reset_counters(cursor, survey_id)
+            self.invalidate_survey(survey_id)
+            return self.get_survey_entry(survey_id)
+
+    def patch_survey(self, survey_id: str, operations: List[Any], base_version: int) -> Optional[Dict[str, Any]]:
+        """Apply a JSON Patch to a survey that is still at base_version; None if it does not exist"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            version, previous_json, exists = self.claim_version(cursor, survey_id, base_version)
+            if not exists:
+                return None
+            # Serialized first: applying the patch may change its values in place
+            delta = jsonutil.dumps(operations)
+            json_data = jsonutil.dumps(apply_patch(load_survey_json(previous_json), operations))
+            cursor.execute('UPDATE surveys SET json_data = ? WHERE id = ?', (json_data, survey_id))
+            self.record_revision(cursor, survey_id, version, previous_json, json_data, delta)
+            self.reset_counters(cursor, survey_id)
+            self.invalidate_survey(survey_id)
+            return self.get_survey_entry(survey_id)
+
+    def get_revisions(self, survey_id: str) -> List[Dict[str, Any]]:
+        """Versions in a survey's definition history, newest first"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT version, created_at, depth, length(data) FROM survey_revisions
+                WHERE survey_id = ? ORDER BY version DESC
+            ''', (survey_id,))
+            return [{"version": version, "createdAt": created_at, "snapshot": depth == 0, "bytes": size}
+                    for version, created_at, depth, size in cursor.fetchall()]
+
+    def get_revision(self, survey_id: str, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """A survey's definition as of a version (default: the latest), rebuilt from the nearest snapshot"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT version, depth FROM survey_revisions
+                WHERE survey_id = ? AND version <= ? ORDER BY version DESC LIMIT 1
+            ''', (survey_id, version if version is not None else 2 ** 62))
+            latest = cursor.fetchone()
+            if latest is None:
+                return None
+            # The snapshot and the deltas after it are the depth + 1 newest rows
+            cursor.execute('''
+                SELECT data FROM survey_revisions
+                WHERE survey_id = ? AND version <= ? ORDER BY version DESC LIMIT ?
+            ''', (survey_id, latest[0], latest[1] + 1))
+            revisions = [row[0] for row in reversed(cursor.fetchall())]
+        return {"id": survey_id, "version": latest[0], "json": jsonutil.dumps(replay(revisions))}
 
     def delete_survey(self, survey_id: str) -> Optional[Dict[str, Any]]:
         """Delete a survey from the database"""
-        survey = self.get_survey(survey_id)
-        if survey:
-            with self.get_connection() as conn:
+        with self.get_connection() as conn:
+            survey = self.get_survey(survey_id)
+            if survey:
                 cursor = conn.cursor()
                 cursor.execute('DELETE FROM surveys WHERE id = ?', (survey_id,))
-                conn.commit()
-        return survey
+                cursor.execute('DELETE FROM survey_revisions WHERE survey_id = ?', (survey_id,))
+                self.reset_counters(cursor, survey_id)
+                self.invalidate_survey(survey_id)
+            return survey
 
-    def post_results(self, post_id: str, survey_result: Dict[str, Any]) -> Dict[str, Any]:
-        """Post survey results"""
+    def insert_responses(self, rows: List[tuple]) -> List[bool]:
+        """Insert (post_id, created_at, payload, submission_id) rows in one transaction
+        
+        Returns whether each row was stored; rows whose submission id was
+        already posted for the same post id are skipped.
+        """
+        inserted = []
+        stored = []
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            
-            # Get existing results or create new entry
-            cursor.execute('SELECT data FROM results WHERE id = ?', (post_id,))
-            row = cursor.fetchone()
-            
-            if row:
-                # Update existing results
-                existing_data = json.loads(row[0])
-                existing_data.append(survey_result)
-                cursor.execute('UPDATE results SET data = ? WHERE id = ?', 
-                            (json.dumps(existing_data), post_id))
-            else:
-                # Create new results entry
-                cursor.execute('INSERT INTO results (id, data) VALUES (?, ?)',
-                            (post_id, json.dumps([survey_result])))
-            
-            conn.commit()
-            return {}
+            for post_id, created_at, payload, submission_id in rows:
+                # Counters below are fed the JSON text either way
+                stored_payload = payload
+                if self.result_format == "binary":
+                    stored_payload = self.encode_payload(cursor, post_id, payload)
+                # Only a repeated submission id is skipped; any other constraint still fails the insert
+                cursor.execute('''
+                    INSERT INTO responses (post_id, created_at, payload, submission_id)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (post_id, submission_id) WHERE submission_id IS NOT NULL DO NOTHING
+                ''', (post_id, created_at, stored_payload, submission_id))
+                inserted.append(cursor.rowcount > 0)
+                if cursor.rowcount > 0:
+                    stored.append((cursor.lastrowid, post_id, payload))
+            if self.counters and stored:
+                self.update_counters(cursor, stored)
+        return inserted
+
+    def result_keys(self, cursor, post_id: str, refresh: bool = False) -> tuple:
+        """(keys, key -> index) of a post's result key dictionary"""
+        entry = None if refresh else self._result_keys.get(post_id)
+        if entry is None:
+            cursor.execute('SELECT key FROM result_keys WHERE post_id = ? ORDER BY key_index', (post_id,))
+            keys = [row[0] for row in cursor.fetchall()]
+            entry = (keys, {key: index for index, key in enumerate(keys)})
+            # Keys added by an open transaction may still be rolled back
+            if not cursor.connection.in_transaction:
+                self._result_keys[post_id] = entry
+        return entry
+
+    def encode_payload(self, cursor, post_id: str, payload: str) -> bytes:
+        """Binary form of a JSON result payload; new keys join the post's dictionary"""
+        with json_timer("decode"):
+            value = jsonutil.loads(payload)
+        keys, key_index = self.result_keys(cursor, post_id)
+        missing = [key for key in dict.fromkeys(resultcodec.object_keys(value)) if key not in key_index]
+        if missing:
+            key_index = dict(key_index)
+            for key in missing:
+                # Computing the index in the INSERT keeps concurrent writers from picking the same one
+                cursor.execute('''
+                    INSERT OR IGNORE INTO result_keys (post_id, key_index, key)
+                    SELECT ?, COALESCE(MAX(key_index) + 1, 0), ? FROM result_keys WHERE post_id = ?
+                ''', (post_id, key, post_id))
+                cursor.execute('SELECT key_index FROM result_keys WHERE post_id = ? AND key = ?', (post_id, key))
+                key_index[key] = cursor.fetchone()[0]
+            self.after_commit(lambda: self._result_keys.pop(post_id, None))
+        with json_timer("encode"):
+            return resultcodec.encode(value, key_index, self.result_compression)
+
+    def decode_payload(self, cursor, post_id: str, payload: Any) -> Any:
+        """A stored result payload, JSON text or binary, as a Python value"""
+        if isinstance(payload, str):
+            return jsonutil.loads(payload)
+        try:
+            return resultcodec.decode(payload, self.result_keys(cursor, post_id)[0])
+        except resultcodec.UnknownKeyIndex:
+            # Written after the cached dictionary was loaded
+            return resultcodec.decode(payload, self.result_keys(cursor, post_id, refresh=True)[0])
+
+    def payload_text(self, cursor, post_id: str, payload: Any) -> str:
+        """A stored result payload as JSON text"""
+        if isinstance(payload, str):
+            return payload
+        return jsonutil.dumps(self.decode_payload(cursor, post_id, payload))
+
+    def has_binary_results(self, cursor, post_id: str) -> bool:
+        """Whether any of a post's results are stored in the binary format"""
+        cursor.execute('''
+            SELECT EXISTS (SELECT 1 FROM responses WHERE post_id = ? AND typeof(payload) = 'blob')
+        ''', (post_id,))
+        return bool(cursor.fetchone()[0])
+
+    def scan_histograms(self, cursor, post_id: str, questions: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Answer histograms from a full scan of a post's stored results"""
+        if not self.has_binary_results(cursor, post_id):
+            return sql_histograms(cursor, post_id, questions)
+        # SQLite's JSON functions cannot read binary payloads; decode them here instead
+        cursor.execute('SELECT payload FROM responses WHERE post_id = ? ORDER BY seq', (post_id,))
+        return answer_histograms(questions, [self.decode_payload(cursor, post_id, row[0])
+                                             for row in cursor.fetchall()])
+
+    def convert_results(self, result_format: str, post_id: Optional[str] = None, batch_size: int = 1000) -> int:
+        """Rewrite stored results in another format, one transaction per batch; returns the rows converted"""
+        if result_format not in resultcodec.RESULT_FORMATS:
+            raise ValueError(f"Unknown result format: {result_format}")
+        wanted = "blob" if result_format == "binary" else "text"
+        converted = 0
+        after = 0
+        while True:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                query = 'SELECT seq, post_id, payload FROM responses WHERE seq > ? AND typeof(payload) != ?'
+                params = [after, wanted]
+                if post_id is not None:
+                    query += ' AND post_id = ?'
+                    params.append(post_id)
+                cursor.execute(query + ' ORDER BY seq LIMIT ?', params + [batch_size])
+                rows = cursor.fetchall()
+                for seq, current, payload in rows:
+                    text = self.payload_text(cursor, current, payload)
+                    if result_format == "binary":
+                        payload = self.encode_payload(cursor, current, text)
+                    else:
+                        payload = text
+                    cursor.execute('UPDATE responses SET payload = ? WHERE seq = ?', (payload, seq))
+            converted += len(rows)
+            if len(rows) < batch_size:
+                return converted
+            after = rows[-1][0]
+
+    def write_responses(self, rows: List[tuple]) -> List[bool]:
+        """Insert rows through the group-commit writer when it is enabled"""
+        # Inside an explicit transaction the rows must land on the caller's connection
+        if self.writer is not None and getattr(self._local, "conn", None) is None:
+            return self.writer.submit(rows).result()
+        return self.insert_responses(rows)
+
+    def submit_results(self, post_id: str, survey_result: Dict[str, Any],
+                       submission_id: Optional[str] = None) -> Future:
+        """Queue survey results on the group-commit writer"""
+        with json_timer("encode"):
+            payload = jsonutil.dumps(survey_result)
+        return self.writer.submit([(post_id, time.time(), payload, submission_id)])
+
+    def post_results(self, post_id: str, survey_result: Dict[str, Any],
+                     submission_id: Optional[str] = None) -> Dict[str, Any]:
+        """Post survey results"""
+        # Append the submission as its own row
+        with json_timer("encode"):
+            payload = jsonutil.dumps(survey_result)
+        self.write_responses([(post_id, time.time(), payload, submission_id)])
+        return {}
+
+    def post_results_batch(self, records: List[Any]) -> List[Dict[str, Any]]:
+        """Post many {postId, surveyResult, submissionId} records in one transaction
+        
+        Returns a status per record: "created", "duplicate" (submission id
+        already stored) or "error" for records that are not valid.
+        """
+        return post_batch(records, self.write_responses)
 
     def get_results(self, post_id: str) -> Optional[Dict[str, Any]]:
         """Get survey results by post ID"""
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT id, data FROM results WHERE id = ?', (post_id,))
-            row = cursor.fetchone()
+            cursor.execute(
+                'SELECT payload FROM responses WHERE post_id = ? ORDER BY seq', (post_id,))
+            rows = cursor.fetchall()
             
-            if row:
+            if rows:
+                with json_timer("decode"):
+                    data = [self.decode_payload(cursor, post_id, row[0]) for row in rows]
                 return {
-                    "id": row[0],
-                    "data": json.loads(row[1])
+                    "id": post_id,
+                    "data": data
                 }
-            return None 
\ No newline at end of file
+            return None
+
+    def get_results_json(self, post_id: str) -> Optional[bytes]:
+        """get_results as a JSON body, with the stored payloads spliced in unparsed"""
+        return results_json(post_id, self.get_response_rows(post_id, None, None))
+
+    def get_response_rows(self, post_id: str, after: Optional[int] = None, limit: Optional[int] = 1000) -> List[tuple]:
+        """(seq, created_at, payload) rows after the after cursor, up to limit (None: all); payloads are JSON text"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT seq, created_at, payload FROM responses
+                WHERE post_id = ? AND seq > ?
+                ORDER BY seq LIMIT ?
+            ''', (post_id, after or 0, -1 if limit is None else limit))
+            rows = cursor.fetchall()
+            if any(not isinstance(row[2], str) for row in rows):
+                rows = [(seq, created_at, self.payload_text(cursor, post_id, payload))
+                        for seq, created_at, payload in rows]
+            return rows
+
+    def get_results_page(self, post_id: str, limit: int, after: Optional[int] = None) -> Dict[str, Any]:
+        """Get one page of survey results; next is the cursor of the following page"""
+        return results_page(post_id, self.get_response_rows(post_id, after, limit), limit)
+
+    def get_results_page_json(self, post_id: str, limit: int, after: Optional[int] = None) -> Optional[bytes]:
+        """get_results_page as a JSON body, with the stored payloads spliced in unparsed; None if the page is empty"""
+        return results_page_json(post_id, self.get_response_rows(post_id, after, limit), limit)
+
+    def iter_response_rows(self, post_id: str, batch_size: int = 1000) -> Iterator[List[tuple]]:
+        """Yield batches of response rows; no connection is held between batches"""
+        return iter_rows(self.get_response_rows, post_id, batch_size)
+
+    def counted_questions(self, post_id: str) -> List[Dict[str, Any]]:
+        """Aggregated questions of the survey a post id belongs to"""
+        survey = self.get_survey(post_id)
+        json_data = survey["json"] if survey else None
+        cached = self._questions.get(post_id)
+        if cached is None or cached[0] != json_data:
+            cached = (json_data, describe_questions(load_survey_json(json_data)))
+            self._questions[post_id] = cached
+        return cached[1]
+
+    def update_counters(self, cursor, stored: List[tuple]):
+        """Add freshly inserted (seq, post_id, payload) rows to materialized counters"""
+        by_post = {}
+        for seq, post_id, payload in stored:
+            by_post.setdefault(post_id, []).append((seq, payload))
+        
+        for post_id, rows in by_post.items():
+            cursor.execute('SELECT through_seq FROM response_counts WHERE post_id = ?', (post_id,))
+            materialized = cursor.fetchone()
+            if not materialized:
+                continue
+            # Rows written while counters were off leave a gap; fall back to a rebuild
+            cursor.execute('SELECT COUNT(*) FROM responses WHERE post_id = ? AND seq > ?',
+                           (post_id, materialized[0]))
+            if cursor.fetchone()[0] != len(rows):
+                self.reset_counters(cursor, post_id)
+                continue
+            
+            histograms = answer_histograms(self.counted_questions(post_id),
+                                           [jsonutil.loads(payload) for _, payload in rows])
+            questions, answers = counter_rows(histograms)
+            cursor.executemany('''
+                INSERT INTO question_counters (post_id, question, answered) VALUES (?, ?, ?)
+                ON CONFLICT (post_id, question) DO UPDATE SET answered = answered + excluded.answered
+            ''', [(post_id,) + row for row in questions])
+            cursor.executemany('''
+                INSERT INTO answer_counters (post_id, question, row, answer, count) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (post_id, question, row, answer) DO UPDATE SET count = count + excluded.count
+            ''', [(post_id,) + row for row in answers])
+            cursor.execute('''
+                UPDATE response_counts SET responses = responses + ?, through_seq = ?
+                WHERE post_id = ?
+            ''', (len(rows), max(seq for seq, _ in rows), post_id))
+
+    def reset_counters(self, cursor, post_id: str):
+        """Drop a post's materialized counters"""
+        cursor.execute('DELETE FROM response_counts WHERE post_id = ?', (post_id,))
+        cursor.execute('DELETE FROM question_counters WHERE post_id = ?', (post_id,))
+        cursor.execute('DELETE FROM answer_counters WHERE post_id = ?', (post_id,))
+
+    def counters_current(self, cursor, post_id: str) -> bool:
+        """Whether a post's counters cover every stored response"""
+        cursor.execute('SELECT through_seq FROM response_counts WHERE post_id = ?', (post_id,))
+        materialized = cursor.fetchone()
+        if not materialized:
+            return False
+        cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM responses WHERE post_id = ?', (post_id,))
+        return cursor.fetchone()[0] == materialized[0]
+
+    def counter_histograms(self, cursor, post_id: str, questions: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Read materialized counters back in the shape sql_histograms returns"""
+        kinds = {question["name"]: question["kind"] for question in questions}
+        histograms = {}
+        for name, kind in kinds.items():
+            histograms[name] = {"answered": 0}
+            histograms[name]["rows" if kind in ("matrix", "items") else "values"] = {}
+        
+        cursor.execute('SELECT question, answered FROM question_counters WHERE post_id = ?', (post_id,))
+        for name, answered in cursor.fetchall():
+            if name in histograms:
+                histograms[name]["answered"] = answered
+        cursor.execute('SELECT question, row, answer, count FROM answer_counters WHERE post_id = ?', (post_id,))
+        for name, row, answer, count in cursor.fetchall():
+            if name not in histograms:
+                continue
+            if kinds[name] in ("matrix", "items"):
+                histograms[name]["rows"].setdefault(row, {})[answer] = count
+            else:
+                histograms[name]["values"][answer] = count
+        return histograms
+
+    def rebuild_counters(self, post_id: Optional[str] = None) -> List[str]:
+        """Recompute materialized counters from the stored responses"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if post_id is None:
+                cursor.execute('SELECT DISTINCT post_id FROM responses')
+                post_ids = [row[0] for row in cursor.fetchall()]
+            else:
+                post_ids = [post_id]
+            for current in post_ids:
+                self.reset_counters(cursor, current)
+                histograms = self.scan_histograms(cursor, current, self.counted_questions(current))
+                questions, answers = counter_rows(histograms)
+                cursor.executemany('''
+                    INSERT INTO question_counters (post_id, question, answered) VALUES (?, ?, ?)
+                ''', [(current,) + row for row in questions])
+                cursor.executemany('''
+                    INSERT INTO answer_counters (post_id, question, row, answer, count) VALUES (?, ?, ?, ?, ?)
+                ''', [(current,) + row for row in answers])
+                cursor.execute('''
+                    INSERT INTO response_counts (post_id, responses, through_seq)
+                    SELECT ?, COUNT(*), COALESCE(MAX(seq), 0) FROM responses WHERE post_id = ?
+                ''', (current, current))
+            return post_ids
+
+    def check_counters(self, post_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Compare materialized counters with a full scan; returns the questions that differ"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if post_id is None:
+                cursor.execute('SELECT post_id FROM response_counts')
+                post_ids = [row[0] for row in cursor.fetchall()]
+            else:
+                post_ids = [post_id]
+            problems = []
+            for current in post_ids:
+                if not self.counters_current(cursor, current):
+                    problems.append({"postId": current, "question": None, "problem": "not materialized or behind"})
+                    continue
+                questions = self.counted_questions(current)
+                expected = summarize(questions, self.scan_histograms(cursor, current, questions))
+                actual = summarize(questions, self.counter_histograms(cursor, current, questions))
+                for wanted, found in zip(expected, actual):
+                    if wanted != found:
+                        problems.append({"postId": current, "question": wanted["name"], "problem": "counts differ"})
+            return problems
+
+    def get_statistics(self, post_id: str) -> Optional[Dict[str, Any]]:
+        """Per-question answer statistics, computed from the survey's question types"""
+        with self.get_connection() as conn:
+            survey = self.get_survey(post_id)
+            if not survey:
+                return None
+            questions = self.counted_questions(post_id)
+            cursor = conn.cursor()
+            if self.counters:
+                # O(questions) read from materialized counters, rebuilt first if stale
+                if not self.counters_current(cursor, post_id):
+                    self.rebuild_counters(post_id)
+                cursor.execute('SELECT responses FROM response_counts WHERE post_id = ?', (post_id,))
+                responses = cursor.fetchone()[0]
+                histograms = self.counter_histograms(cursor, post_id, questions)
+            else:
+                cursor.execute('SELECT COUNT(*) FROM responses WHERE post_id = ?', (post_id,))
+                responses = cursor.fetchone()[0]
+                histograms = self.scan_histograms(cursor, post_id, questions)
+            return {
+                "id": post_id,
+                "responses": responses,
+                "questions": summarize(questions, histograms)
+            }
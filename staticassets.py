@@ -0,0 +1,92 @@
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+from typing import Dict, Optional
+from fastapi import Request
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+from httpcache import ENCODINGS, EncodedBody, cached_response
+
+# Content-hashed build output never changes under the same URL
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Everything else is revalidated with its ETag on each use
+REVALIDATE = "no-cache"
+
+# File suffixes of variants compressed ahead of time
+PRECOMPRESSED_SUFFIXES = {
+    "br": ".br",
+    "gzip": ".gz"
+}
+
+class StaticAsset:
+    """A file held in memory with its ETag and compressed variants"""
+
+    def __init__(self, path: str, cache_control: str):
+        with open(path, "rb") as f:
+            content = f.read()
+        self.body = EncodedBody(content)
+        for encoding in ENCODINGS:
+            compressed = path + PRECOMPRESSED_SUFFIXES[encoding]
+            if os.path.isfile(compressed):
+                with open(compressed, "rb") as f:
+                    self.body.add_variant(encoding, f.read())
+        self.tag = hashlib.sha1(content).hexdigest()[:20]
+        self.media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.cache_control = cache_control
+
+class StaticAssets:
+    """Serves the SPA shell and the build's static files from memory
+
+    asset-manifest.json is read once to learn which files are content-hashed
+    (served as immutable). Files are loaded on first request and kept, keyed by
+    their real path, so each file is held once however the URL spells it.
+    """
+
+    def __init__(self, public_dir: str = "public"):
+        self.public_dir = os.path.realpath(public_dir)
+        self.static_dir = os.path.join(self.public_dir, "static")
+        self.index = StaticAsset(os.path.join(self.public_dir, "index.html"), REVALIDATE)
+        self.hashed = {self.relative_path(path) for path in self.manifest_paths(self.public_dir)}
+        self._assets: Dict[str, StaticAsset] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def manifest_paths(public_dir: str):
+        """Paths under /static listed in the build's asset manifest"""
+        manifest_path = os.path.join(public_dir, "asset-manifest.json")
+        if not os.path.isfile(manifest_path):
+            return []
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        return [url[len("/static/"):] for url in manifest.get("files", {}).values()
+                if url.startswith("/static/")]
+
+    def relative_path(self, path: str) -> Optional[str]:
+        """Canonical path of /static/<path> relative to the static directory; None if it points outside"""
+        resolved = os.path.realpath(os.path.join(self.static_dir, path))
+        if os.path.commonpath([resolved, self.static_dir]) != self.static_dir:
+            return None
+        return os.path.relpath(resolved, self.static_dir)
+
+    async def get(self, path: str) -> Optional[StaticAsset]:
+        """The asset at /static/<path>, or None if there is no such file"""
+        key = self.relative_path(path)
+        if key is None:
+            return None
+        asset = self._assets.get(key)
+        if asset is not None:
+            return asset
+        resolved = os.path.join(self.static_dir, key)
+        if not os.path.isfile(resolved):
+            return None
+        # Reading a large file would stall the event loop
+        asset = await run_in_threadpool(StaticAsset, resolved, IMMUTABLE if key in self.hashed else REVALIDATE)
+        with self._lock:
+            asset = self._assets.setdefault(key, asset)
+        return asset
+
+    async def respond(self, request: Request, asset: StaticAsset) -> Response:
+        headers = {"Cache-Control": asset.cache_control}
+        return await cached_response(request, asset.body, asset.tag, asset.media_type, headers)
@@ -0,0 +1,182 @@
+import time
+from concurrent.futures import Future
+import jsonutil
+from profiling import json_timer
+from typing import List, Dict, Any, Optional, Iterator, Callable, ContextManager, Protocol
+
+# Engines open_storage can create
+STORAGE_ENGINES = ("sqlite", "memory")
+
+class SurveyStorage(Protocol):
+    """Methods the service calls on a storage engine
+
+    Surveys are {"id", "name", "json"} dicts (plus "version" from
+    get_survey_entry, store_survey and patch_survey); results are stored one row per submission and read back
+    as (seq, created_at, payload) rows with seq increasing across all posts.
+    """
+
+    # Group-commit writer; None when posts are written synchronously
+    writer: Any
+
+    def transaction(self) -> ContextManager: ...
+
+    def close(self): ...
+
+    def get_surveys(self, fields: Optional[List[str]] = None, limit: Optional[int] = None,
+                    after: Optional[str] = None, name_prefix: Optional[str] = None) -> List[Dict[str, Any]]: ...
+
+    def get_survey(self, survey_id: str) -> Optional[Dict[str, Any]]: ...
+
+    def get_survey_entry(self, survey_id: str) -> Optional[Dict[str, Any]]: ...
+
+    def get_catalog_version(self) -> int: ...
+
+    def add_survey(self, name: Optional[str] = None) -> Dict[str, Any]: ...
+
+    def change_name(self, survey_id: str, name: str) -> Optional[Dict[str, Any]]: ...
+
+    def store_survey(self, survey_id: str, name: Optional[str], json_data: Optional[str],
+                     base_version: Optional[int] = None) -> Dict[str, Any]: ...
+
+    def patch_survey(self, survey_id: str, operations: List[Any], base_version: int) -> Optional[Dict[str, Any]]: ...
+
+    def get_revisions(self, survey_id: str) -> List[Dict[str, Any]]: ...
+
+    def get_revision(self, survey_id: str, version: Optional[int] = None) -> Optional[Dict[str, Any]]: ...
+
+    def delete_survey(self, survey_id: str) -> Optional[Dict[str, Any]]: ...
+
+    def submit_results(self, post_id: str, survey_result: Dict[str, Any],
+                       submission_id: Optional[str] = None) -> Future: ...
+
+    def post_results(self, post_id: str, survey_result: Dict[str, Any],
+                     submission_id: Optional[str] = None) -> Dict[str, Any]: ...
+
+    def post_results_batch(self, records: List[Any]) -> List[Dict[str, Any]]: ...
+
+    def get_results(self, post_id: str) -> Optional[Dict[str, Any]]: ...
+
+    def get_results_json(self, post_id: str) -> Optional[bytes]: ...
+
+    def get_response_rows(self, post_id: str, after: Optional[int] = None,
+                          limit: Optional[int] = 1000) -> List[tuple]: ...
+
+    def get_results_page(self, post_id: str, limit: int, after: Optional[int] = None) -> Dict[str, Any]: ...
+
+    def get_results_page_json(self, post_id: str, limit: int, after: Optional[int] = None) -> Optional[bytes]: ...
+
+    def iter_response_rows(self, post_id: str, batch_size: int = 1000) -> Iterator[List[tuple]]: ...
+
+    def get_statistics(self, post_id: str) -> Optional[Dict[str, Any]]: ...
+
+def open_storage(engine: str = "sqlite", **options) -> SurveyStorage:
+    """Create the storage engine named by configuration; options go to its constructor"""
+    if engine == "sqlite":
+        from sqlitedbadapter import SQLiteDBAdapter
+        return SQLiteDBAdapter(**options)
+    if engine == "memory":
+        from memorystorage import MemoryStorage
+        return MemoryStorage(**options)
+    raise ValueError(f"Unknown storage engine: {engine} (expected one of {', '.join(STORAGE_ENGINES)})")
+
+def batch_record_error(record: Any) -> Optional[str]:
+    """Describe why a batch record cannot be stored, or None if it is valid"""
+    if record is None:
+        return "Malformed or empty record"
+    if not isinstance(record, dict):
+        return "Record must be a JSON object"
+    if record.get("postId") in (None, ""):
+        return "Missing postId"
+    if not isinstance(record.get("surveyResult"), dict):
+        return "surveyResult must be a JSON object"
+    if isinstance(record.get("submissionId"), (dict, list)):
+        return "submissionId must be a string"
+    return None
+
+def post_batch(records: List[Any], insert: Callable[[List[tuple]], List[bool]]) -> List[Dict[str, Any]]:
+    """Store the valid records through insert and return a status per record
+
+    insert takes (post_id, created_at, payload, submission_id) rows and returns
+    False for each duplicate submission id. Statuses are "created",
+    "duplicate" or "error" for records that are not valid.
+    """
+    statuses = []
+    rows = []
+    positions = []
+    now = time.time()
+    for index, record in enumerate(records):
+        error = batch_record_error(record)
+        if error:
+            statuses.append({"index": index, "status": "error", "error": error})
+            continue
+        submission_id = record.get("submissionId")
+        statuses.append({"index": index, "status": None})
+        rows.append((str(record["postId"]), now, jsonutil.dumps(record["surveyResult"]),
+                     None if submission_id is None else str(submission_id)))
+        positions.append(index)
+
+    if rows:
+        for index, inserted in zip(positions, insert(rows)):
+            statuses[index]["status"] = "created" if inserted else "duplicate"
+    return statuses
+
+def results_json(post_id: str, rows: List[tuple]) -> Optional[bytes]:
+    """get_results as a JSON body built from get_response_rows, with the payloads spliced in unparsed"""
+    if not rows:
+        return None
+    return jsonutil.raw_object({
+        "id": jsonutil.dumps(post_id),
+        "data": jsonutil.join_array(row[2] for row in rows)
+    })
+
+def results_page(post_id: str, rows: List[tuple], limit: int) -> Dict[str, Any]:
+    """One page of results from get_response_rows; next is the cursor of the following page"""
+    with json_timer("decode"):
+        data = [jsonutil.loads(row[2]) for row in rows]
+    return {
+        "id": post_id,
+        "data": data,
+        "next": rows[-1][0] if len(rows) == limit else None
+    }
+
+def results_page_json(post_id: str, rows: List[tuple], limit: int) -> Optional[bytes]:
+    """results_page as a JSON body, with the stored payloads spliced in unparsed; None if the page is empty"""
+    if not rows:
+        return None
+    return jsonutil.raw_object({
+        "id": jsonutil.dumps(post_id),
+        "data": jsonutil.join_array(row[2] for row in rows),
+        "next": jsonutil.dumps(rows[-1][0] if len(rows) == limit else None)
+    })
+
+def iter_rows(get_rows: Callable[[str, Optional[int], int], List[tuple]], post_id: str,
+              batch_size: int) -> Iterator[List[tuple]]:
+    """Yield batches of get_rows(post_id, after, batch_size), following the seq cursor"""
+    after = None
+    while True:
+        rows = get_rows(post_id, after, batch_size)
+        if rows:
+            yield rows
+        if len(rows) < batch_size:
+            return
+        after = rows[-1][0]
+
+def load_demo_data() -> Dict[str, Any]:
+    """The demo surveys and results, imported on first use so startup does not pay for them"""
+    from demo_surveys import demo_data
+    return demo_data
+
+def demo_rows() -> tuple:
+    """Demo surveys as (id, name, json text) rows and demo results as (post_id, payload) rows"""
+    demo_data = load_demo_data()
+    surveys = []
+    for survey in demo_data["surveys"]:
+        json_data = survey.get("json", "{}")
+        if isinstance(json_data, dict):
+            json_data = jsonutil.dumps(json_data)
+        elif not isinstance(json_data, str):
+            json_data = "{}"
+        surveys.append((survey["id"], survey["name"], json_data))
+    results = [(result["id"], jsonutil.dumps(answer))
+               for result in demo_data["results"] for answer in result["data"]]
+    return surveys, results
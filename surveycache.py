@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Hashable
+from sharedepochs import EpochTable
+
+class SurveyCache:
+    """Bounded LRU cache of survey definitions with a time-to-live
+
+    Readers take a token() before querying the database and pass it to put().
+    Any invalidation in between bumps the generation and the put is dropped,
+    so a read that raced with a write can never re-insert the old definition.
+
+    With a shared EpochTable, invalidations also reach the caches of other
+    processes: entries remember their key's epoch from token() time and are
+    ignored once another process has bumped it.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0, epochs: Optional[EpochTable] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.epochs = epochs
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Cached value, or None if absent or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is not None and entry[1] > time.monotonic()
+                    and (entry[2] is None or self.epochs.read(entry[2]) == entry[3])):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def token(self, key: Hashable) -> tuple:
+        """Generation, epoch slot and epoch of key to hand back to put() after reading from the database"""
+        if self.epochs is None:
+            return self._generation, None, None
+        slot = self.epochs.slot(key)
+        return self._generation, slot, self.epochs.read(slot)
+
+    def put(self, key: Hashable, value: Any, token: tuple):
+        """Cache a value unless something was invalidated since token() was taken"""
+        with self._lock:
+            if token[0] != self._generation:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl, token[1], token[2])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+        if self.epochs is not None:
+            self.epochs.bump(key)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and occupancy"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None
+            }
@@ -0,0 +1,17 @@
+import os
+import time
+
+# Crockford base32, as used by ULIDs
+ULID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+# Survey id formats the adapter can allocate
+ID_STRATEGIES = ("sequence", "ulid")
+
+def new_ulid() -> str:
+    """26-character ULID: 48-bit millisecond timestamp plus 80 random bits, sortable by creation time"""
+    value = (int(time.time() * 1000) << 80) | int.from_bytes(os.urandom(10), "big")
+    chars = []
+    for _ in range(26):
+        chars.append(ULID_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
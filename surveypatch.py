@@ -0,0 +1,197 @@
+import copy
+from typing import List, Dict, Any, Optional, Tuple
+import jsonutil
+from surveyschema import load_survey_json
+
+class PatchError(ValueError):
+    """A JSON Patch (RFC 6902) that is malformed or does not apply to the document"""
+
+class VersionConflict(Exception):
+    """The survey changed since the version an edit was based on"""
+
+    def __init__(self, current: Optional[int]):
+        super().__init__(f"Survey is at version {current}")
+        self.current = current
+
+def equal(a: Any, b: Any) -> bool:
+    """JSON equality: unlike ==, true is not 1"""
+    if a is b:
+        return True
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(equal(value, b[key]) for key, value in a.items())
+    if isinstance(a, list):
+        return len(a) == len(b) and all(map(equal, a, b))
+    return a == b
+
+def escape(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+def parse_pointer(pointer: Any) -> List[str]:
+    """Reference tokens of a JSON Pointer (RFC 6901)"""
+    if pointer == "":
+        return []
+    if not isinstance(pointer, str) or not pointer.startswith("/"):
+        raise PatchError(f"Invalid JSON pointer: {pointer!r}")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+def array_index(array: List[Any], token: str, end: bool) -> int:
+    """Position token refers to; end allows "-" and len(array), as add does"""
+    if token == "-" and end:
+        return len(array)
+    if not token.isdigit() or (token != "0" and token.startswith("0")):
+        raise PatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    if index > len(array) or (index == len(array) and not end):
+        raise PatchError(f"Array index out of range: {index}")
+    return index
+
+def child(container: Any, token: str) -> Any:
+    if isinstance(container, dict):
+        if token not in container:
+            raise PatchError(f"No member {token!r}")
+        return container[token]
+    if isinstance(container, list):
+        return container[array_index(container, token, False)]
+    raise PatchError(f"Cannot descend into {type(container).__name__} with {token!r}")
+
+def resolve(document: Any, tokens: List[str]) -> Any:
+    for token in tokens:
+        document = child(document, token)
+    return document
+
+def add(document: Any, tokens: List[str], value: Any) -> Any:
+    if not tokens:
+        return value
+    parent = resolve(document, tokens[:-1])
+    if isinstance(parent, dict):
+        parent[tokens[-1]] = value
+    elif isinstance(parent, list):
+        parent.insert(array_index(parent, tokens[-1], True), value)
+    else:
+        raise PatchError(f"Cannot add to {type(parent).__name__}")
+    return document
+
+def remove(document: Any, tokens: List[str]) -> Tuple[Any, Any]:
+    """The document without the value at tokens, and that value"""
+    if not tokens:
+        raise PatchError("Cannot remove the whole document")
+    parent = resolve(document, tokens[:-1])
+    value = child(parent, tokens[-1])
+    if isinstance(parent, dict):
+        del parent[tokens[-1]]
+    else:
+        del parent[int(tokens[-1])]
+    return document, value
+
+def operation_value(operation: Dict[str, Any]) -> Any:
+    if "value" not in operation:
+        raise PatchError(f"{operation.get('op')} operation without a value")
+    return operation["value"]
+
+def apply_patch(document: Any, operations: Any) -> Any:
+    """Apply a JSON Patch, changing document in place; returns the new document
+
+    Stops at the first operation that fails, so callers must discard a
+    document that raised PatchError.
+    """
+    if not isinstance(operations, list):
+        raise PatchError("A patch must be a JSON array of operations")
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise PatchError("Each patch operation must be a JSON object")
+        op = operation.get("op")
+        tokens = parse_pointer(operation.get("path"))
+        if op == "add":
+            document = add(document, tokens, operation_value(operation))
+        elif op == "remove":
+            document, _ = remove(document, tokens)
+        elif op == "replace":
+            value = operation_value(operation)
+            if not tokens:
+                document = value
+            else:
+                parent = resolve(document, tokens[:-1])
+                child(parent, tokens[-1])
+                parent[tokens[-1] if isinstance(parent, dict) else int(tokens[-1])] = value
+        elif op in ("move", "copy"):
+            source = parse_pointer(operation.get("from"))
+            if op == "move":
+                if tokens[:len(source)] == source and len(tokens) > len(source):
+                    raise PatchError("Cannot move a value into one of its children")
+                document, value = remove(document, source)
+            else:
+                value = copy.deepcopy(resolve(document, source))
+            document = add(document, tokens, value)
+        elif op == "test":
+            if not equal(resolve(document, tokens), operation_value(operation)):
+                raise PatchError(f"Test failed at {operation.get('path')}")
+        else:
+            raise PatchError(f"Unknown patch operation: {op!r}")
+    return document
+
+def diff(old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+    """A JSON Patch that turns old into new
+
+    Objects are compared member by member. Arrays keep their common prefix and
+    suffix, so inserting or deleting a question or page costs one operation.
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        operations = [{"op": "remove", "path": f"{path}/{escape(key)}"} for key in old if key not in new]
+        for key, value in new.items():
+            if key in old:
+                operations.extend(diff(old[key], value, f"{path}/{escape(key)}"))
+            else:
+                operations.append({"op": "add", "path": f"{path}/{escape(key)}", "value": value})
+        return operations
+    if isinstance(old, list) and isinstance(new, list):
+        shortest = min(len(old), len(new))
+        start = 0
+        while start < shortest and equal(old[start], new[start]):
+            start += 1
+        end = 0
+        while end < shortest - start and equal(old[-1 - end], new[-1 - end]):
+            end += 1
+        old_middle = old[start:len(old) - end]
+        new_middle = new[start:len(new) - end]
+        common = min(len(old_middle), len(new_middle))
+        operations = []
+        for offset in range(common):
+            operations.extend(diff(old_middle[offset], new_middle[offset], f"{path}/{start + offset}"))
+        # From the back, so earlier indexes stay valid
+        for offset in reversed(range(common, len(old_middle))):
+            operations.append({"op": "remove", "path": f"{path}/{start + offset}"})
+        for offset in range(common, len(new_middle)):
+            operations.append({"op": "add", "path": f"{path}/{start + offset}", "value": new_middle[offset]})
+        return operations
+    if equal(old, new):
+        return []
+    return [{"op": "replace", "path": path, "value": new}]
+
+def revision_data(previous: Optional[Tuple[int, Any]], json_data: Optional[str],
+                  delta: Optional[str], snapshot_interval: int) -> Tuple[int, str]:
+    """(depth, data) of the revision recording a change to json_data
+
+    previous is (depth, json text) of the survey's latest revision and the
+    definition before the change, or None if it has no revision yet. The
+    revision stores the patch (delta, or the diff of the two texts), unless
+    snapshot_interval deltas already follow the last snapshot or the patch is
+    not smaller than the definition itself; then it stores the full definition
+    with depth 0.
+    """
+    json_data = json_data if json_data is not None else "{}"
+    if previous is None or previous[0] >= snapshot_interval:
+        return 0, json_data
+    if delta is None:
+        delta = jsonutil.dumps(diff(load_survey_json(previous[1]), load_survey_json(json_data)))
+    if len(delta) >= len(json_data):
+        return 0, json_data
+    return previous[0] + 1, delta
+
+def replay(revisions: List[str]) -> Dict[str, Any]:
+    """Definition after a snapshot and the deltas that follow it, oldest first"""
+    document = load_survey_json(revisions[0])
+    for delta in revisions[1:]:
+        document = apply_patch(document, jsonutil.loads(delta))
+    return document
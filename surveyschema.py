@@ -0,0 +1,50 @@
+import json
+from typing import List, Dict, Any, Iterator
+
+# Elements that lay out or decorate a survey but never hold an answer
+LAYOUT_TYPES = {"panel", "flowpanel", "html", "image"}
+
+def load_survey_json(json_data: Any) -> Dict[str, Any]:
+    """Parse a stored survey definition, tolerating empty or invalid JSON"""
+    if isinstance(json_data, dict):
+        return json_data
+    if not json_data:
+        return {}
+    try:
+        survey = json.loads(json_data)
+    except ValueError:
+        return {}
+    return survey if isinstance(survey, dict) else {}
+
+def iter_elements(elements: List[Any]) -> Iterator[Dict[str, Any]]:
+    """Yield answer-holding elements, descending into panels"""
+    for element in elements or []:
+        if not isinstance(element, dict):
+            continue
+        if element.get("type") in ("panel", "flowpanel"):
+            yield from iter_elements(element.get("elements"))
+        elif element.get("type") not in LAYOUT_TYPES and element.get("name"):
+            yield element
+
+def iter_questions(survey: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Yield every question of a survey definition in page order"""
+    for page in survey.get("pages") or []:
+        if isinstance(page, dict):
+            yield from iter_elements(page.get("elements"))
+    # Single-page surveys may list their elements at the top level
+    yield from iter_elements(survey.get("elements"))
+
+def value_name(question: Dict[str, Any]) -> str:
+    """Key under which a question's answer is stored in a result"""
+    return question.get("valueName") or question["name"]
+
+def question_names(survey: Dict[str, Any]) -> List[str]:
+    """Result keys of a survey in page order, without duplicates"""
+    names = []
+    seen = set()
+    for question in iter_questions(survey):
+        name = value_name(question)
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
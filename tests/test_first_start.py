@@ -0,0 +1,57 @@
+"""Several worker processes opening the same new database at once
+
+serve.py and uvicorn --workers start every worker's lifespan together, so
+the schema migrations and the demo seeding must tolerate racing each other.
+
+    python -m pytest tests/test_first_start.py
+"""
+import multiprocessing
+import os
+import sqlite3
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlitedbadapter import SCHEMA_VERSION, SQLiteDBAdapter
+from storage import demo_rows
+
+PROCESSES = 4
+ROUNDS = 5
+
+
+def open_adapter(db_path, barrier, errors):
+    barrier.wait()
+    try:
+        SQLiteDBAdapter(db_path, pool_size=1, seed_demo=True).close()
+    except Exception as error:
+        errors.put(f"{type(error).__name__}: {error}")
+
+
+def test_workers_open_a_new_database_together(tmp_path):
+    context = multiprocessing.get_context("fork")
+    surveys, results = demo_rows()
+    for round_number in range(ROUNDS):
+        db_path = str(tmp_path / f"first-start-{round_number}.db")
+        barrier = context.Barrier(PROCESSES)
+        errors = context.Queue()
+        processes = [context.Process(target=open_adapter, args=(db_path, barrier, errors))
+                     for _ in range(PROCESSES)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(60)
+        failures = []
+        while not errors.empty():
+            failures.append(errors.get())
+        assert failures == []
+        assert [process.exitcode for process in processes] == [0] * PROCESSES
+
+        conn = sqlite3.connect(db_path)
+        try:
+            assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+            # Seeded exactly once
+            assert conn.execute('SELECT COUNT(*) FROM surveys').fetchone()[0] == len(surveys)
+            assert conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0] == len(results)
+        finally:
+            conn.close()